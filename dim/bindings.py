@@ -48,6 +48,8 @@ keypad_aliases = {XK_KP_Space: XK_space,
                   XK_KP_8: XK_8,
                   XK_KP_9: XK_9}
 
+unbound = object() # marks a miss in a compiled lookup table
+
 class InvalidSymbol(Exception):
     "Invalid key symbol, alias, or desigantor."
     pass
@@ -99,7 +101,10 @@ class BindingMap(dict):
     Finally, symbols may be aliased to other symbols. This is convenient
     for, e.g., symbols on the numeric keypad (see keypad_aliases, above).
     Aliases are also inherited from the parent map, if there is one, with
-    the child's aliases overriding those of the parent."""
+    the child's aliases overriding those of the parent.
+
+    Each map keeps a serial number which is incremented whenever one of
+    its bindings is changed, so that users may notice the change."""
 
     def __init__(self, mapping, parent=None, aliases={}):
         super(BindingMap, self).__init__(self.parse_bindings(mapping))
@@ -108,6 +113,43 @@ class BindingMap(dict):
                         if isinstance(parent, BindingMap)
                         else {})
         self.aliases.update(aliases)
+        self.serial = 0
+
+    def stamp(self):
+        """Return a value that changes whenever a binding in this map or
+        any of its ancestors changes."""
+        return (self.serial,
+                self.parent.stamp()
+                if isinstance(self.parent, BindingMap)
+                else None)
+
+    def __setitem__(self, key, value):
+        super(BindingMap, self).__setitem__(key, value)
+        self.serial += 1
+
+    def __delitem__(self, key):
+        super(BindingMap, self).__delitem__(key)
+        self.serial += 1
+
+    def clear(self):
+        super(BindingMap, self).clear()
+        self.serial += 1
+
+    def pop(self, *args):
+        self.serial += 1
+        return super(BindingMap, self).pop(*args)
+
+    def popitem(self):
+        self.serial += 1
+        return super(BindingMap, self).popitem()
+
+    def setdefault(self, *args):
+        self.serial += 1
+        return super(BindingMap, self).setdefault(*args)
+
+    def update(self, *args, **kwargs):
+        super(BindingMap, self).update(*args, **kwargs)
+        self.serial += 1
 
     def parse_bindings(self, bindings):
         """Given either a mapping object or a sequence of (key, value)
@@ -214,7 +256,14 @@ class Bindings(object):
     Those two objects (the symbol and the modifier set), together with a
     boolean representing whether a given event is a press or release
     (press=True, release=False) provide a key for lookup in the actual
-    bindings map."""
+    bindings map.
+
+    Since that process is fairly expensive, we also keep a table that maps
+    physical keys of the form (code, state, press), where code is a keycode
+    or button number, directly to bindings. It is filled in as events are
+    looked up, and flushed whenever the keyboard or modifier mapping
+    changes, or the bindings map (or one of its ancestors) is replaced or
+    modified, so that most lookups take a single probe."""
 
     def __init__(self, bindings, keymap, modmap):
         self.bindings = bindings
@@ -222,6 +271,10 @@ class Bindings(object):
         self.modmap = modmap
         self.keymap.scry_modifiers(self.modmap)
         self.conn = self.keymap.conn
+        self.table = {} # compiled lookup table, indexed by physical key
+        self.table_bindings = None # bindings map used to compile the table
+        self.table_version = None # binding & keymap serials at compile time
+        self.grabs = {} # established grabs, indexed by window
 
     def modifiers(self, bit):
         """Yield the names of each of the modifiers currently bound to the
@@ -265,6 +318,11 @@ class Bindings(object):
 
     def __getitem__(self, key):
         """Return the binding associated with the key (symbol, state, press)."""
+        return self.resolve(key)
+
+    def resolve(self, key):
+        """Search the bindings map and its parents for the logical key
+        (symbol, state, press), and return the associated binding."""
         symbol, state, press = key
         symbol = self.bindings.aliases.get(symbol, symbol)
         bindings = self.bindings
@@ -277,6 +335,37 @@ class Bindings(object):
             bindings = bindings.parent
         raise KeyError(symbol, state, press)
 
+    def ignored_modifiers(self):
+        """Return a mask of the modifier bits that can never affect the
+        result of a lookup, and so are stripped from compiled keys."""
+        return 0
+
+    def logical_key(self, code, state, press):
+        """Translate a physical key into a logical one."""
+        return (code, state, press)
+
+    def lookup(self, code, state, press):
+        """Return the binding associated with the physical key
+        (code, state, press), consulting the compiled table first."""
+        version = (self.bindings.stamp(), self.keymap.serial)
+        if (self.table_bindings is not self.bindings or
+            self.table_version != version):
+            self.table = {}
+            self.table_bindings = self.bindings
+            self.table_version = version
+        key = (code, state & ~self.ignored_modifiers(), press)
+        try:
+            binding = self.table[key]
+        except KeyError:
+            try:
+                binding = self.resolve(self.logical_key(*key))
+            except KeyError:
+                binding = unbound
+            self.table[key] = binding
+        if binding is unbound:
+            raise KeyError(key)
+        return binding
+
     def locking_modifier_combinations(self):
         """Yield combinations of bound locking modifiers."""
         for mods in all_combinations([[0, lock]
@@ -287,6 +376,10 @@ class Bindings(object):
         """Establish passive grabs for each binding."""
         pass
 
+    def forget_grabs(self, window):
+        """Forget the grabs established on a window that is going away."""
+        self.grabs.pop(window, None)
+
 class KeyBindings(Bindings):
     """Support lookup of key bindings via KeyPress & KeyRelease events.
 
@@ -307,7 +400,6 @@ class KeyBindings(Bindings):
                              else KeyBindingMap(bindings))
         super(KeyBindings, self).__init__(bindings, keymap, modmap)
         self.binding_stack = []
-        self.grabs = {}
 
     def push(self, bindings, symbol, window, time):
         """Push the current bindings onto the stack and grab the keyboard."""
@@ -328,8 +420,14 @@ class KeyBindings(Bindings):
         if isinstance(event, (KeyPressEvent, KeyReleaseEvent)):
             press = True if isinstance(event, KeyPressEvent) else False
             state = event.state
-            symbol = self.keymap.lookup_key(event.detail, state)
             time = event.time
+            if not self.binding_stack:
+                # Outside of a submap, we can usually get away with a
+                # single probe of the compiled table.
+                binding = self.lookup(event.detail, state, press)
+                if not isinstance(binding, (dict, KeyBindings)):
+                    return binding
+            symbol = self.keymap.lookup_key(event.detail, state)
             key = (symbol, state, press)
         else:
             key = event
@@ -359,6 +457,14 @@ class KeyBindings(Bindings):
             self.unwind(time)
         return binding
 
+    def ignored_modifiers(self):
+        # Lock and Num Lock may select a different keysym, but Scroll Lock
+        # never does.
+        return self.keymap.scroll_lock
+
+    def logical_key(self, keycode, state, press):
+        return (self.keymap.lookup_key(keycode, state), state, press)
+
     def compute_grabs(self):
         """Yield (modifiers, keycode) grab pairs for the current bindings."""
         # We establish grabs only for top-level bindings. If an action in
@@ -398,28 +504,67 @@ class ButtonBindings(Bindings):
                     if isinstance(bindings, ButtonBindingMap)
                     else ButtonBindingMap(bindings))
         super(ButtonBindings, self).__init__(bindings, keymap, modmap)
+        self.grab_locks = {} # locking modifiers at grab time, by window
+        self.pointer_modes = {} # pointer grab modes, by window
 
     def __getitem__(self, key):
         if isinstance(key, ButtonPressEvent):
-            key = (key.detail, key.state, True)
+            value = self.lookup(key.detail, key.state, True)
         elif isinstance(key, ButtonReleaseEvent):
-            key = (key.detail, key.state, False)
-        button, state, press = key
-        value = super(ButtonBindings, self).__getitem__((button, state, press))
+            value = self.lookup(key.detail, key.state, False)
+        else:
+            value = super(ButtonBindings, self).__getitem__(key)
         # Return only the action, not the event mask.
         return value[1]
 
+    def ignored_modifiers(self):
+        # Locking modifiers don't participate in button bindings.
+        return reduce(or_, self.keymap.locking_mods, 0)
+
+    def compute_grabs(self):
+        """Yield (modifiers, button, event-mask) grab triples for the
+        current bindings."""
+        for key, value in self.bindings.items():
+            modset, button, press = key
+            mask, action = value
+            yield (self.bucky_bits(modset), button, mask)
+
+    def grab_button(self, window, modifiers, button, mask):
+        pointer_mode = self.pointer_modes.get(window, GrabMode.Async)
+        for locks in self.locking_modifier_combinations():
+            self.conn.core.GrabButton(True, window, mask,
+                                      pointer_mode, GrabMode.Async,
+                                      Window._None, Cursor._None,
+                                      button, locks | modifiers)
+
+    def update_grabs(self, window, grabs):
+        """Update grabs that have changed since the previous update."""
+        lock_combinations = tuple(self.locking_modifier_combinations())
+        if (window in self.grabs and
+            self.grab_locks[window] == lock_combinations):
+            prev_grabs = self.grabs[window]
+        else:
+            # Start with a clean slate.
+            self.conn.core.UngrabButton(ButtonIndex.Any, window, ModMask.Any)
+            prev_grabs = frozenset()
+        self.grabs[window] = grabs # save for next update
+        self.grab_locks[window] = lock_combinations
+        for mods, button, mask in prev_grabs - grabs:
+            for locks in lock_combinations:
+                self.conn.core.UngrabButton(button, window, locks | mods)
+        for mods, button, mask in grabs - prev_grabs:
+            self.grab_button(window, mods, button, mask)
+
+    def forget_grabs(self, window):
+        super(ButtonBindings, self).forget_grabs(window)
+        self.grab_locks.pop(window, None)
+
+    def restore_grabs(self, window, button, modifiers):
+        """Re-establish our grabs for the given button and modifiers, which
+        someone else may have replaced or released."""
+        for mods, b, mask in self.grabs.get(window, ()):
+            if b == button and mods == modifiers:
+                self.grab_button(window, mods, b, mask)
+
     def establish_grabs(self, window):
-        def grabs():
-            for key, value in self.bindings.items():
-                modset, button, press = key
-                mask, action = value
-                modifiers = self.bucky_bits(modset)
-                yield (modifiers, button, mask)
-        self.conn.core.UngrabButton(ButtonIndex.Any, window, ModMask.Any)
-        for modifiers, button, mask in grabs():
-            for locks in self.locking_modifier_combinations():
-                self.conn.core.GrabButton(True, window, mask,
-                                          GrabMode.Async, GrabMode.Async,
-                                          Window._None, Cursor._None,
-                                          button, locks | modifiers)
+        self.update_grabs(window, frozenset(self.compute_grabs()))
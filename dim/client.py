@@ -35,6 +35,11 @@ class Client(EventHandler, PropertyManager):
                         EventMask.EnterWindow |
                         EventMask.VisibilityChange)
 
+    # If the window manager grabs its global bindings on the root window
+    # rather than on each frame, it will release those grabs while a client
+    # for which this is false has the focus.
+    global_bindings = True
+
     # ICCCM properties
     wm_name = PropertyDescriptor("WM_NAME", StringProperty, "")
     wm_icon_name = PropertyDescriptor("WM_ICON_NAME", StringProperty, "")
@@ -131,6 +136,8 @@ class Client(EventHandler, PropertyManager):
         with self.disable_structure_notify():
             self.conn.core.ReparentWindow(self.window, self.frame,
                                           self.offset.x, self.offset.y)
+        self.manager.parents[self.frame] = self.screen.root
+        self.manager.parents[self.window] = self.frame
 
         # Register for shape change notifications, and, if the client
         # window is shaped, adapt the frame to its shape.
@@ -171,18 +178,20 @@ class Client(EventHandler, PropertyManager):
                 size = self.geometry.size()
                 gravity = self.wm_normal_hints.win_gravity
                 geometry = self.frame_geometry.resize(size, bw, gravity)
+                # The client window may already be gone, in which case
+                # these requests will fail; we don't wait to find out.
                 with self.disable_structure_notify():
-                    try:
-                        self.conn.core.ReparentWindowChecked(self.window,
-                                                             self.screen.root,
-                                                             geometry.x,
-                                                             geometry.y).check()
-                    except BadWindow:
-                        pass
-                    else:
-                        self.conn.core.ChangeSaveSet(SetMode.Delete,
-                                                     self.window)
+                    core, root = self.conn.core, self.screen.root
+                    errors = self.manager.errors
+                    errors.register(core.ReparentWindowChecked(self.window,
+                                                               root,
+                                                               geometry.x,
+                                                               geometry.y))
+                    errors.register(core.ChangeSaveSetChecked(SetMode.Delete,
+                                                              self.window))
+                self.manager.parents[self.window] = self.screen.root
         self.conn.core.DestroyWindow(self.frame)
+        self.manager.parents.pop(self.frame, None)
         self.frame = None
 
     def decorate(self):
@@ -475,14 +484,21 @@ class Client(EventHandler, PropertyManager):
         def set_input_focus(window, time):
             self.log.debug("Setting input focus to window 0x%x at time %d.",
                            window, time)
-            try:
-                self.conn.core.SetInputFocusChecked(InputFocus.PointerRoot,
-                                                    window, time).check()
-            except (BadMatch, BadWindow):
+            def focus_error(error):
+                if not isinstance(error, (BadMatch, BadWindow)):
+                    raise error
                 self.log.warning("Error trying to focus window 0x%x.", window)
-                return None
-            else:
-                return time
+                if (self.focus_time == time and
+                    self.atoms["WM_TAKE_FOCUS"] not in self.wm_protocols):
+                    self.focus_time = None
+                    self.manager.focus_failed(self)
+
+            # We'll assume that the request succeeds; if it doesn't,
+            # we'll find out later.
+            cookie = self.conn.core.SetInputFocusChecked(InputFocus.PointerRoot,
+                                                         window, time)
+            self.manager.errors.register(cookie, focus_error)
+            return time
 
         if self.focus_override:
             # We'll occasionally want to preempt focus of a client window
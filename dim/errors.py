@@ -0,0 +1,77 @@
+# -*- mode: Python; coding: utf-8 -*-
+
+"""Deferred handling of X protocol errors."""
+
+from collections import deque
+import logging
+
+import xcb
+
+__all__ = ["ErrorDispatcher"]
+
+log = logging.getLogger("errors")
+
+class ErrorDispatcher(object):
+    """Route the errors generated by checked requests to handlers, without
+    waiting for each request to complete.
+
+    Calling check() on a cookie immediately after issuing a checked request
+    costs a round trip. Instead, we may register the cookie along with an
+    error handler, and go about our business; pending cookies are checked
+    in a batch once the event queue has drained. XCB keeps track of the
+    sequence number of each request, and if it has already seen a reply or
+    event with a later sequence number, it knows that the request has been
+    processed without asking the server. Otherwise, checking the latest
+    pending cookie first costs a single round trip, after which all the
+    earlier ones are known, too."""
+
+    def __init__(self, conn):
+        assert isinstance(conn, xcb.Connection)
+        self.conn = conn
+        self.pending = deque() # (cookie, handler) pairs, in request order
+
+    def __len__(self):
+        return len(self.pending)
+
+    def register(self, cookie, handler=lambda error: None):
+        """Register an error handler for a checked request. The handler
+        will be called with the exception raised by checking the cookie.
+        Returns the cookie."""
+        self.pending.append((cookie, handler))
+        return cookie
+
+    def check(self, cookie=None):
+        """Check all pending requests, and call the handlers for any that
+        failed. If a cookie is given, check and handle only that request,
+        leaving the rest for the next batch. Returns the number of errors
+        handled."""
+        if cookie is None:
+            pending, self.pending = self.pending, deque()
+        else:
+            pending = [entry for entry in self.pending if entry[0] is cookie]
+            for entry in pending:
+                self.pending.remove(entry)
+        errors = {}
+        for i in reversed(xrange(len(pending))):
+            cookie, handler = pending[i]
+            try:
+                cookie.check()
+            except xcb.ProtocolException as e:
+                errors[i] = e
+
+        # Run the handlers in request order. Handlers may issue new
+        # requests, and even register new cookies; those will be
+        # checked next time. A handler that fails (e.g., by re-raising
+        # an error it doesn't know how to handle) must not prevent the
+        # others from running, nor escape into the event loop.
+        for i in sorted(errors):
+            cookie, handler = pending[i]
+            error = errors[i]
+            log.debug("Handling %s for major opcode %d.",
+                      error.__class__.__name__, error.args[0].major_opcode)
+            try:
+                handler(error)
+            except Exception:
+                log.exception("Error handler failed for %s.",
+                              error.__class__.__name__)
+        return len(errors)
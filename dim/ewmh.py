@@ -475,7 +475,7 @@ class NetWMState(NetCapability):
     def send_net_wm_state(self, window, action, first, second=0, source=0):
         "Send a _NET_WM_STATE client message to the root window."
         if isinstance(window, Client):
-            window = client.window
+            window = window.window
         send_client_message(self.conn, self.screen.root, False,
                             (EventMask.SubstructureRedirect |
                              EventMask.SubstructureNotify),
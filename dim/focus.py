@@ -1,6 +1,6 @@
 # -*- mode: Python; coding: utf-8 -*-
 
-from collections import deque
+from collections import OrderedDict
 import logging
 import exceptions
 
@@ -11,12 +11,73 @@ from manager import *
 from properties import WMState
 from xutil import *
 
-__all__ = ["FocusPolicy", "SloppyFocus", "ClickToFocus"]
+__all__ = ["FocusList", "FocusPolicy", "SloppyFocus", "ClickToFocus"]
 
-@client_message("_DIM_ENSURE_FOCUS")
-class EnsureFocus(ClientMessage):
-    """Try to ensure that some client has the input focus."""
-    pass
+class FocusList(object):
+    """An ordered set of clients, most-recently focused first.
+
+    Moving a client to the head of the list, removing a client, and
+    testing membership all take constant time. Internally, we keep the
+    clients in an ordered dictionary in least-recently focused order,
+    so that moving a client to the head is just a deletion followed by
+    an insertion at the end."""
+
+    def __init__(self, clients=()):
+        self.clients = OrderedDict()
+        for client in reversed(tuple(clients)):
+            self.appendleft(client)
+
+    def __len__(self):
+        return len(self.clients)
+
+    def __nonzero__(self):
+        return bool(self.clients)
+
+    def __contains__(self, client):
+        return client in self.clients
+
+    def __iter__(self):
+        return reversed(self.clients)
+
+    def __getitem__(self, index):
+        if index == 0:
+            try:
+                return next(reversed(self.clients))
+            except StopIteration:
+                raise IndexError("focus list index out of range")
+        return tuple(self)[index]
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, list(self))
+
+    def appendleft(self, client):
+        """Move a client to the head of the list, adding it if need be."""
+        self.clients.pop(client, None)
+        self.clients[client] = True
+
+    def remove(self, client):
+        """Remove a client from the list. Like list.remove, raises
+        ValueError if the client is not present."""
+        try:
+            del self.clients[client]
+        except KeyError:
+            raise exceptions.ValueError(client)
+
+    def discard(self, client):
+        """Remove a client from the list if it is present."""
+        self.clients.pop(client, None)
+
+    def select(self, test):
+        """Yield the clients that satisfy the given test, most-recently
+        focused first."""
+        for client in self:
+            if test(client):
+                yield client
+
+    def first(self, test=lambda client: True):
+        """Return the most-recently focused client that satisfies the
+        given test, or None if there is no such client."""
+        return next(self.select(test), None)
 
 class FocusPolicy(WindowManager):
     """A focus policy determines how and when to assign the input focus."""
@@ -26,8 +87,9 @@ class FocusPolicy(WindowManager):
     def __init__(self, **kwargs):
         super(FocusPolicy, self).__init__(**kwargs)
 
-        self.focus_list = deque() # most-recently focused first
-        self.pending_focus = None # from an EnsureFocus message
+        self.focus_list = FocusList() # most-recently focused first
+        self.pending_focus = None # from an ensure-focus request
+        self.ensure_focus_request = None # (window, time) pair
 
         # Create a default focus window. We'll give the input focus to this
         # window when no client window has it so that global key bindings
@@ -41,6 +103,7 @@ class FocusPolicy(WindowManager):
                                            self.screen.root_visual,
                                            CW.OverrideRedirect,
                                            [True]).check()
+        self.parents[self.default_focus_window] = self.screen.root
         self.key_bindings.establish_grabs(self.default_focus_window)
         self.conn.core.MapWindow(self.default_focus_window)
 
@@ -57,10 +120,7 @@ class FocusPolicy(WindowManager):
         self.ensure_focus(focus)
 
     def unmanage(self, client, **kwargs):
-        try:
-            self.focus_list.remove(client)
-        except exceptions.ValueError:
-            pass
+        self.focus_list.discard(client)
         return super(FocusPolicy, self).unmanage(client, **kwargs)
 
     def focus(self, client, time):
@@ -68,14 +128,23 @@ class FocusPolicy(WindowManager):
         return true and move the client to the head of the focus list;
         otherwise, return false."""
         if client and client.focus(time):
-            try:
-                self.focus_list.remove(client)
-            except exceptions.ValueError:
-                pass
             self.focus_list.appendleft(client)
+            self.update_global_grabs(client)
             return True
         return False
 
+    def focus_failed(self, client):
+        """A focus offer that we assumed was accepted turned out to have
+        failed, so we'll drop the client from the focus list. If it had
+        been the current focus, continue the search for a focus target
+        with the remaining clients."""
+        was_current = (client == self.pending_focus or
+                       (self.focus_list and self.focus_list[0] == client))
+        self.focus_list.discard(client)
+        if was_current:
+            self.pending_focus = None
+            self.ensure_focus()
+
     def focus_default_window(self, time):
         """Set the input focus to our default focus window."""
         if time is None:
@@ -84,6 +153,7 @@ class FocusPolicy(WindowManager):
         self.conn.core.SetInputFocus(InputFocus.PointerRoot,
                                      self.default_focus_window,
                                      time)
+        self.update_global_grabs()
 
     def unfocus(self, client):
         """Note that a client no longer has the input focus."""
@@ -97,30 +167,31 @@ class FocusPolicy(WindowManager):
             return super(FocusPolicy, self).current_focus
 
     def ensure_focus(self, client=None, time=Time.CurrentTime):
-        """Send a message to ourselves requesting that some client receive
-        the input focus. If the client argument is provided, it must be
-        either a client instance or a window; that window will be tried
-        first in the search for a client to focus."""
-        # We use a client message for ensuring focus so that we can be sure
-        # that any outstanding requests or events generated as a result
-        # thereof have been completely processed before we go groveling
-        # through the focus list. See the EnsureFocus handler, below,
-        # for the the actual algorithm.
+        """Request that some client receive the input focus. If the client
+        argument is provided, it must be either a client instance or a
+        window; that window will be tried first in the search for a client
+        to focus. Requests made before the search takes place are collapsed
+        into one."""
+        # We defer the search so that we can be sure that any outstanding
+        # requests or events generated as a result thereof have been
+        # completely processed before we go groveling through the focus
+        # list. See choose_focus, below, for the actual algorithm.
         window = (Window._None
                   if client is None
                   else getattr(client, "window", client))
-        send_client_message(self.conn, self.screen.root, False,
-                            (EventMask.SubstructureRedirect |
-                             EventMask.SubstructureNotify),
-                            self.screen.root, self.atoms["_DIM_ENSURE_FOCUS"],
-                            32, [time, window, 0, 0, 0])
+        if self.ensure_focus_request:
+            # The most recently requested window and time take precedence.
+            last_window, last_time = self.ensure_focus_request
+            self.ensure_focus_request = (window or last_window,
+                                         time or last_time)
+        else:
+            self.ensure_focus_request = (window, time)
+            self.defer(self.choose_focus)
 
     def find_focus_clients(self, test=lambda x: False):
         """Yield clients in the focus list that satisfy the given test
         (cf. WindowManager.find_clients)."""
-        for client in self.focus_list:
-            if test(client):
-                yield client
+        return self.focus_list.select(test)
 
     def update_for_changed_mapping(self):
         super(FocusPolicy, self).update_for_changed_mapping()
@@ -159,25 +230,23 @@ class FocusPolicy(WindowManager):
             self.__log.debug("Ensuring focus due to UnmapNotify event.")
             self.ensure_focus()
 
-    @handler(EnsureFocus)
-    def handle_ensure_focus(self, client_message):
-        # There should be a timestamp in the first data slot and a window ID
-        # (which may be None) in the second.
-        time, window = client_message.data.data32[:2]
-        self.__log.debug("Received ensure-focus message (0x%x, %d).",
-                         window, time)
+    def choose_focus(self):
+        """Satisfy a pending ensure-focus request."""
+        window, time = self.ensure_focus_request
+        self.ensure_focus_request = None
+        self.__log.debug("Ensuring focus (0x%x, %d).", window, time)
 
         def choose_focus_client():
-            # Start with the window specified in the message, if any.
+            # Start with the window specified in the request, if any.
             if window:
                 client = self.get_client(window, True)
                 if client:
                     yield client
 
             # Next we'll try the focus list, starting with the most recently
-            # focused client. We run over a copy because failed focus attempts
-            # will cause clients to be removed from the focus list.
-            for client in list(self.focus_list):
+            # focused client. A successful focus attempt modifies the list,
+            # but we stop iterating as soon as one succeeds.
+            for client in self.focus_list:
                 yield client
 
             # Now try the window that has the input focus, if there is one.
@@ -188,8 +257,9 @@ class FocusPolicy(WindowManager):
                     yield client
 
             # Finally, we'll just pick clients at random.
-            for client in set(self.clients.values()) - set(self.focus_list):
-                yield client
+            for client in self.clients.values():
+                if client not in self.focus_list:
+                    yield client
 
         for client in choose_focus_client():
             if self.focus(client, time):
@@ -220,9 +290,17 @@ class SloppyFocus(FocusPolicy):
 
     __log = logging.getLogger("focus.sloppy")
 
-    def __init__(self, **kwargs):
+    def __init__(self, focus_delay=0, **kwargs):
         super(SloppyFocus, self).__init__(**kwargs)
 
+        # When the pointer sweeps quickly across a series of windows, we
+        # can avoid focusing each one in turn by waiting for it to settle
+        # for focus_delay seconds. Only the most recently entered window
+        # is kept as a target.
+        self.focus_delay = focus_delay
+        self.focus_timer = None
+        self.focus_target = None # (window, time) pair
+
         # In a comment in the source of AHWM (event.c,v 1.72 2002/02/16),
         # Alex Hioreanu writes:
         #
@@ -254,7 +332,39 @@ class SloppyFocus(FocusPolicy):
             self.check_typed_window_event(event.event, LeaveNotifyEvent) or
             self.client_update):
             return
-        self.focus(self.get_client(event.event), event.time)
+        if self.focus_delay and (self.focus_timer or
+                                 self.check_enter_pending(event)):
+            # The pointer is still on the move; wait for it to settle.
+            self.cancel_timer(self.focus_timer)
+            self.focus_target = (event.event, event.time)
+            self.focus_timer = self.schedule(self.focus_delay,
+                                             self.focus_settled)
+        else:
+            self.focus(self.get_client(event.event), event.time)
+
+    def check_enter_pending(self, event):
+        """Return true if the queue holds an EnterNotify event that would
+        move the focus to a different client than the given one. A single
+        crossing generates enters on both a frame and its client window,
+        and those don't count; nor do enters that we'd ignore anyway."""
+        client = self.get_client(event.event)
+        for pending in self.get_pending_events():
+            if (isinstance(pending, EnterNotifyEvent) and
+                pending.mode == NotifyMode.Normal and
+                pending.detail != NotifyDetail.Inferior):
+                other = self.get_client(pending.event)
+                if other and other != client:
+                    return True
+        return False
+
+    def focus_settled(self):
+        """Focus the last window entered by the pointer."""
+        self.focus_timer = None
+        window, time = self.focus_target
+        self.focus_target = None
+        client = self.get_client(window)
+        if client:
+            self.focus(client, time)
 
     @handler((UnmapNotifyEvent,
               MapNotifyEvent,
@@ -285,6 +395,7 @@ class ClickToFocus(FocusPolicy):
 
     def __init__(self, ignore_focus_click=False, **kwargs):
         self.ignore_focus_click = ignore_focus_click
+        self.focus_click_frames = set() # frames with a focus-click grab
         super(ClickToFocus, self).__init__(**kwargs)
 
     def manage(self, window, adopted=False):
@@ -293,6 +404,22 @@ class ClickToFocus(FocusPolicy):
             self.grab_focus_click(client)
         return client
 
+    def unmanage(self, client, **kwargs):
+        self.focus_click_frames.discard(client.frame)
+        return super(ClickToFocus, self).unmanage(client, **kwargs)
+
+    def update_for_changed_mapping(self):
+        super(ClickToFocus, self).update_for_changed_mapping()
+
+        # The locking modifiers may have changed, and our focus-click
+        # grabs may have been released along with the others on each
+        # frame; either way, we'll establish them anew.
+        frames, self.focus_click_frames = self.focus_click_frames, set()
+        for frame in frames:
+            client = self.frames.get(frame)
+            if client:
+                self.grab_focus_click(client)
+
     def focus(self, client, time, **kwargs):
         if super(ClickToFocus, self).focus(client, time, **kwargs):
             # Once a client is focused, we can release our focus grab.
@@ -300,11 +427,7 @@ class ClickToFocus(FocusPolicy):
             # responsible for proxying all button press events to
             # the client. We'll re-establish our grab when the client
             # loses focus.
-            self.conn.core.UngrabButton(1, client.frame, ModMask.Any)
-
-            # The above may release passive button grabs established by
-            # our global button bindings, so we'll re-establish those here.
-            client.establish_grabs(button_bindings=self.button_bindings)
+            self.ungrab_focus_click(client)
             return True
         else:
             return False
@@ -317,11 +440,28 @@ class ClickToFocus(FocusPolicy):
         if not client.frame:
             self.__log.warning("Unable to establish grab for focus click.")
             return
-        self.conn.core.GrabButton(False, client.frame,
-                                  EventMask.ButtonPress,
-                                  GrabMode.Sync, GrabMode.Async,
-                                  Window._None, Cursor._None,
-                                  1, ModMask.Any)
+        if client.frame in self.focus_click_frames:
+            return
+        # We grab only unmodified clicks (modulo locks), so that we don't
+        # disturb the passive grabs for our global button bindings.
+        for locks in self.button_bindings.locking_modifier_combinations():
+            self.conn.core.GrabButton(False, client.frame,
+                                      EventMask.ButtonPress,
+                                      GrabMode.Sync, GrabMode.Async,
+                                      Window._None, Cursor._None,
+                                      1, locks)
+        self.focus_click_frames.add(client.frame)
+
+    def ungrab_focus_click(self, client):
+        if client.frame not in self.focus_click_frames:
+            return
+        for locks in self.button_bindings.locking_modifier_combinations():
+            self.conn.core.UngrabButton(1, client.frame, locks)
+        self.focus_click_frames.discard(client.frame)
+
+        # If there's a binding for an unmodified click, our grab will
+        # have replaced it; re-establish it now.
+        self.button_bindings.restore_grabs(client.frame, 1, 0)
 
     @handler(ButtonPressEvent)
     def handle_button_press(self, event):
@@ -10,12 +10,20 @@ __all__ = ["FontCache"]
 log = logging.getLogger("font")
 
 class FontCache(object):
-    """A simple cache for core X fonts."""
+    """A simple cache for core X fonts.
 
-    def __init__(self, conn):
+    If an error dispatcher is supplied, fonts are opened without waiting
+    for the server; an invalid name is detected later, at which point the
+    font ID is re-used for the fallback font."""
+
+    fallback_font = "fixed"
+
+    def __init__(self, conn, errors=None):
         assert isinstance(conn, xcb.Connection)
         self.conn = conn
+        self.errors = errors
         self.fonts = {}
+        self.cookies = {} # unchecked open requests, indexed by font ID
 
     def __getitem__(self, name):
         """Return the font with the given name."""
@@ -24,11 +32,29 @@ class FontCache(object):
 
         if name not in self.fonts:
             font = self.conn.generate_id()
-            try:
-                self.conn.core.OpenFontChecked(font, len(name), name).check()
-            except BadName:
-                log.warning('Invalid font name "%s"; falling back to "fixed".',
-                            name)
-                font = self["fixed"]
+            cookie = self.conn.core.OpenFontChecked(font, len(name), name)
+            if self.errors is not None:
+                def open_fallback(error):
+                    log.warning('Invalid font name "%s"; '
+                                'falling back to "%s".',
+                                name, self.fallback_font)
+                    fallback = self.fallback_font
+                    self.conn.core.OpenFont(font, len(fallback), fallback)
+                self.errors.register(cookie, open_fallback)
+                self.cookies[font] = cookie
+            else:
+                try:
+                    cookie.check()
+                except BadName:
+                    log.warning('Invalid font name "%s"; '
+                                'falling back to "%s".',
+                                name, self.fallback_font)
+                    font = self[self.fallback_font]
             self.fonts[name] = font
         return self.fonts[name]
+
+    def check(self, font):
+        """Check whether an asynchronously opened font was found, falling
+        back if it wasn't. Returns true if the fallback font was opened."""
+        cookie = self.cookies.pop(font, None)
+        return bool(cookie and self.errors.check(cookie))
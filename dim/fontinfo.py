@@ -1,9 +1,11 @@
 # -*- mode: Python; coding: utf-8 -*-
 
 from array import array
+from bisect import bisect_right
+from itertools import izip
 
 import xcb
-from xcb.xproto import CHARINFO
+from xcb.xproto import BadFont, CHARINFO
 
 from atom import AtomCache
 
@@ -12,16 +14,26 @@ __all__ = ["FontInfoCache", "FontInfo"]
 class FontInfoCache(object):
     """A simple cache for information about core X fonts."""
 
-    def __init__(self, conn, atoms=None):
+    def __init__(self, conn, atoms=None, fonts=None):
         assert isinstance(conn, xcb.Connection)
         self.conn = conn
         self.font_info = {}
         self.atoms = atoms if atoms else AtomCache(conn)
+        self.fonts = fonts
 
     def __getitem__(self, font):
         if font not in self.font_info:
-            query = self.conn.core.QueryFont(font)
-            self.font_info[font] = FontInfo(query.reply(), self.atoms)
+            try:
+                reply = self.conn.core.QueryFont(font).reply()
+            except BadFont:
+                # The font may have been opened asynchronously under an
+                # invalid name. Checking just that request gives the font
+                # cache a chance to substitute a fallback; any other
+                # pending errors are left for the event loop.
+                if not (self.fonts and self.fonts.check(font)):
+                    raise
+                reply = self.conn.core.QueryFont(font).reply()
+            self.font_info[font] = FontInfo(reply, self.atoms)
         return self.font_info[font]
 
 class FontInfo(object):
@@ -55,6 +67,10 @@ class FontInfo(object):
                              self.max_char_or_byte2)
 
         self.default_char_info = self.char_info(self.default_char, None)
+        self.default_width = (self.default_char_info.character_width
+                              if self.default_char_info
+                              else 0)
+        self.widths = self.decode_widths()
 
         for p in self.properties:
             if p.name == atoms["SPACING"]:
@@ -100,15 +116,69 @@ class FontInfo(object):
             return self.default_char_info if default is True else default
         return info
 
+    def decode_widths(self, charinfo_shorts=6):
+        """Decode the widths of all of the characters in the font into an
+        array indexed by character code. Undefined and nonexistent
+        characters get the width of the default character, or zero if
+        that character is itself undefined or nonexistent."""
+        (min_byte1, max_byte1, min_byte2, max_byte2) = self.index_bounds
+        row = max_byte2 - min_byte2 + 1
+        n = (max_byte1 - min_byte1 + 1) * row
+
+        # A CHARINFO is six 16-bit quantities: the left and right side
+        # bearings, the width, the ascent and descent, and the attributes.
+        # We decode each metric column with a single strided slice.
+        infos = array("h")
+        infos.fromstring(str(self.char_infos))
+        metrics = [infos[i::charinfo_shorts] for i in range(5)]
+        column = metrics[2]
+
+        # A nonexistent character has all-zero metrics, save perhaps for
+        # its attributes. Such characters tend to come in long runs, so we
+        # note which characters exist, one byte each, and fill in whole
+        # runs of nonexistent ones at a time.
+        exists = array("B", map(any, izip(*metrics))).tostring()
+        default = array("h", [self.default_width])
+        end = 0
+        while True:
+            start = exists.find("\0", end)
+            if start < 0:
+                break
+            end = exists.find("\1", start)
+            if end < 0:
+                end = len(exists)
+            column[start:end] = default * (end - start)
+
+        # If the server omitted them, all of the characters have the
+        # same metrics.
+        if len(column) < n:
+            column.extend(array("h", [self.min_bounds.character_width]) *
+                          (n - len(column)))
+
+        widths = array("h", [self.default_width]) * ((max_byte1 << 8) +
+                                                     max_byte2 + 1)
+        for byte1 in range(min_byte1, max_byte1 + 1):
+            i = (byte1 - min_byte1) * row
+            widths[(byte1 << 8) + min_byte2:
+                   (byte1 << 8) + max_byte2 + 1] = column[i:i + row]
+        return widths
+
+    def char_widths(self, string):
+        """Yield the widths of the characters in the given string."""
+        widths = self.widths
+        n = len(widths)
+        default_width = self.default_width
+        for char in string:
+            code = ord(char)
+            yield widths[code] if code < n else default_width
+
     def text_width(self, string):
         """Compute the width of the given string."""
         if self.spacing == "M" or self.spacing == "C":
             # Monospaced font.
             return self.min_bounds.character_width * len(string)
         else:
-            return sum(info.character_width
-                       for info in map(self.char_info, string)
-                       if info)
+            return sum(self.char_widths(string))
 
     def truncate(self, string, max_width):
         """Return a possibly-truncated version of the given string that fits
@@ -131,10 +201,10 @@ class FontInfo(object):
         if max_width < ellipsis_width:
             return ""
         max_width -= ellipsis_width
-        char_widths = [info.character_width
-                       for info in map(self.char_info, string)
-                       if info]
-        i = len(string)
-        while sum(char_widths[:i]) > max_width:
-            i -= 1
-        return string[:i] + ellipsis
+
+        # The offsets of the characters form a non-decreasing sequence,
+        # so we can find the longest prefix that fits by bisection.
+        offsets = [0]
+        for width in self.char_widths(string):
+            offsets.append(offsets[-1] + width)
+        return string[:bisect_right(offsets, max_width) - 1] + ellipsis
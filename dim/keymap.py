@@ -43,18 +43,17 @@ class KeyboardMap(InputDeviceMapping):
         setup = conn.get_setup()
         self.min_keycode = setup.min_keycode
         self.max_keycode = setup.max_keycode
-        self.keycodes = {} # frozen sets, indexed by keysym
+        self.keycodes = {} # frozen sets, indexed by keysym; see update
+        self.serial = 0 # incremented whenever the mapping changes
+        self.clear_modifiers()
         super(KeyboardMap, self).__init__(conn, cookie,
                                           self.min_keycode, len(self))
 
         if modmap:
             self.scry_modifiers(modmap)
-        else:
-            self.clear_modifiers()
 
     def refresh(self, first_keycode=None, count=None):
         """Request an updated keyboard mapping for the specified keycodes."""
-        self.keycodes = {} # flush the cache
         if first_keycode is None:
             first_keycode = self.min_keycode
         if count is None:
@@ -78,19 +77,53 @@ class KeyboardMap(InputDeviceMapping):
                                   (count * n, len(reply.keysyms)))
 
         reply = cookie.reply()
+        self.serial += 1
         if first_keycode == self.min_keycode and count == len(self):
             # Replace the entire mapping.
             check_reply(reply, count)
             self.keysyms_per_keycode = reply.keysyms_per_keycode
             self.keysyms = array("I", reply.keysyms)
+
+            # Rebuild the keysym → keycodes index in one pass.
+            index = {}
+            for keycode, keysym in self.effective_keysyms(first_keycode,
+                                                          count):
+                index.setdefault(keysym, set()).add(keycode)
+            self.keycodes = dict((keysym, frozenset(keycodes))
+                                 for keysym, keycodes in index.iteritems())
         else:
             # Only replace the keysym range that was requested.
             check_reply(reply, count, self.keysyms_per_keycode)
+            old_keysyms = list(self.effective_keysyms(first_keycode, count))
             n = self.keysyms_per_keycode
             i = (first_keycode - self.min_keycode) * n
             j = i + (count * n)
             self.keysyms[i:j] = array("I", reply.keysyms)
 
+            # Update the index entries for the keysyms that were or are
+            # now attached to the replaced keycodes.
+            replaced = frozenset(range(first_keycode, first_keycode + count))
+            index = dict((keysym, set()) for keycode, keysym in old_keysyms)
+            for keycode, keysym in self.effective_keysyms(first_keycode,
+                                                          count):
+                index.setdefault(keysym, set()).add(keycode)
+            for keysym, keycodes in index.iteritems():
+                keycodes |= self.keycodes.get(keysym, frozenset()) - replaced
+                if keycodes:
+                    self.keycodes[keysym] = frozenset(keycodes)
+                else:
+                    self.keycodes.pop(keysym, None)
+
+    def effective_keysyms(self, first_keycode, count):
+        """Yield (keycode, keysym) pairs for each effective keysym of the
+        count keycodes starting at first_keycode."""
+        n = self.keysyms_per_keycode
+        for keycode in range(first_keycode, first_keycode + count):
+            i = (keycode - self.min_keycode) * n
+            keysyms = self.keysyms[i:i + n]
+            for index in range(n):
+                yield (keycode, self.effective_keysym(keysyms, index))
+
     @staticmethod
     def effective_index(keysyms, index):
         """From the X11 protocol specification (Chapter 5, ¶3):
@@ -211,18 +244,8 @@ class KeyboardMap(InputDeviceMapping):
         return (self.max_keycode - self.min_keycode) + 1
 
     def keysym_to_keycodes(self, keysym):
-        """Return the set of keycodes that generate the given symbol.
-        These sets are fairly expensive to compute, so we cache them."""
-        try:
-            return self.keycodes[keysym]
-        except KeyError:
-            keycodes = frozenset(i
-                                 for j in range(self.keysyms_per_keycode)
-                                 for i in range(self.min_keycode,
-                                                self.max_keycode + 1)
-                                 if self[(i, j)] == keysym)
-            self.keycodes[keysym] = keycodes
-            return keycodes
+        """Return the set of keycodes that generate the given symbol."""
+        return self.keycodes.get(keysym, frozenset())
 
     def keysym_to_keycode(self, keysym):
         """Return an arbitrary keycode that generates the given symbol,
@@ -256,6 +279,7 @@ class KeyboardMap(InputDeviceMapping):
         "num_lock", "scroll_lock", "alt", "meta", "super", and "hyper"
         if there is an appropriate keysym attached to a keycode that is
         attached to any of the modifiers Mod1 through Mod5."""
+        old_modifiers = self.modifier_assignments()
         self.clear_modifiers()
 
         # Find any appropriate keysym currently acting as the Lock modifier.
@@ -295,6 +319,13 @@ class KeyboardMap(InputDeviceMapping):
                                     self.num_lock,
                                     self.scroll_lock])
         self.non_locking_mods = 0xff & ~reduce(or_, self.locking_mods)
+        if self.modifier_assignments() != old_modifiers:
+            self.serial += 1
+
+    def modifier_assignments(self):
+        """Return a tuple describing the current modifier assignments."""
+        return (self.lock, self.group, self.num_lock, self.scroll_lock,
+                self.alt, self.meta, self.super, self.hyper)
 
 class ModifierMap(InputDeviceMapping):
     def refresh(self):
@@ -2,6 +2,7 @@
 
 from keysymdef import *
 from keysymdef import _names, _keysyms, _legacy_codes
+from keysymdef import _upper_case, _lower_case
 
 NoSymbol = 0
 
@@ -45,8 +46,20 @@ def keysym_to_string(keysym):
 
 def upper(keysym):
     """Return the corresponding uppercase keysym."""
-    return string_to_keysym(keysym_to_string(keysym).upper()) or keysym
+    # The precomputed table covers every keysym defined in keysymdef.h,
+    # but not every possible Unicode keysym.
+    try:
+        return _upper_case[keysym]
+    except KeyError:
+        if is_unicode_key(keysym) and keysym not in _names:
+            return string_to_keysym(keysym_to_string(keysym).upper()) or keysym
+        return keysym
 
 def lower(keysym):
     """Return the corresponding lowercase keysym."""
-    return string_to_keysym(keysym_to_string(keysym).lower()) or keysym
+    try:
+        return _lower_case[keysym]
+    except KeyError:
+        if is_unicode_key(keysym) and keysym not in _names:
+            return string_to_keysym(keysym_to_string(keysym).lower()) or keysym
+        return keysym
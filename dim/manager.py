@@ -5,8 +5,11 @@
 from collections import deque
 import logging
 from functools import wraps
+from heapq import heappop, heappush
+from itertools import count
 from os import execvp
 from select import select
+from timeit import default_timer
 
 import xcb
 from xcb.xproto import *
@@ -18,6 +21,7 @@ from client import Client
 from color import ColorCache
 from cursor import FontCursor
 from decorator import Decorator
+from errors import ErrorDispatcher
 from event import StopPropagation, UnhandledEvent, EventHandler, handler
 from font import FontCache
 from fontinfo import FontInfoCache
@@ -82,8 +86,18 @@ class WindowManager(EventHandler, PropertyManager):
     client_selectors = []
     decorator_selectors = []
 
+    # Events that report the pointer position in root coordinates.
+    pointer_event_types = (KeyPressEvent, KeyReleaseEvent,
+                           ButtonPressEvent, ButtonReleaseEvent,
+                           MotionNotifyEvent,
+                           EnterNotifyEvent, LeaveNotifyEvent)
+
+    # How long (in seconds) we'll trust the last reported pointer position
+    # before asking the server for a fresh one.
+    pointer_max_age = 0.5
+
     def __init__(self, display=None, screen=None,
-                 key_bindings={}, button_bindings={},
+                 key_bindings={}, button_bindings={}, global_grabs=False,
                  **kwargs):
         self.conn = xcb.connect(display)
         self.screen_number = (screen
@@ -99,12 +113,21 @@ class WindowManager(EventHandler, PropertyManager):
         self.clients = {} # managed clients, indexed by window ID
         self.frames = {} # client frames, indexed by window ID
         self.client_update = None # for move/resize
-        self.parents = {self.screen.root: None}
+        self.global_grabs = global_grabs # grab bindings on the root?
+        self.pointer = None # last known pointer position
+        self.pointer_time = None # when we learned it (local clock)
+        self.parents = {self.screen.root: None} # local model of window tree
+        self.subwindows = {} # queried subwindows, indexed by parent ID
+        self.timers = [] # heap of [deadline, serial, function] entries
+        self.timer_serial = count()
+        self.deferred = [] # functions waiting for a fence
+        self.fenced = [] # functions whose fence has been passed
+        self.errors = ErrorDispatcher(self.conn)
         self.atoms = AtomCache(self.conn)
         self.colors = ColorCache(self.conn, self.screen.default_colormap)
         self.cursors = FontCursor(self.conn)
-        self.fonts = FontCache(self.conn)
-        self.font_infos = FontInfoCache(self.conn, self.atoms)
+        self.fonts = FontCache(self.conn, self.errors)
+        self.font_infos = FontInfoCache(self.conn, self.atoms, self.fonts)
         self.modmap = ModifierMap(self.conn)
         self.keymap = KeyboardMap(self.conn, modmap=self.modmap)
         self.key_bindings = KeyBindings(key_bindings,
@@ -113,6 +136,11 @@ class WindowManager(EventHandler, PropertyManager):
         self.button_bindings = ButtonBindings(button_bindings,
                                               self.keymap,
                                               self.modmap)
+        if global_grabs:
+            # Root button grabs freeze the pointer until we've seen which
+            # client the click was meant for; see handle_button_press.
+            self.button_bindings.pointer_modes[self.screen.root] = \
+                GrabMode.Sync
         self.heads = HeadManager(self.conn, self.screen, self)
         self.shape = query_extension(self.conn, "SHAPE", xcb.shape.key)
 
@@ -142,8 +170,13 @@ class WindowManager(EventHandler, PropertyManager):
                       self.screen_number)
             raise
 
+        self.update_global_grabs()
+
         # Adopt any suitable top-level windows.
-        self.adopt(self.conn.core.QueryTree(self.screen.root).reply().children)
+        children = self.conn.core.QueryTree(self.screen.root).reply().children
+        for window in children:
+            self.parents[window] = self.screen.root
+        self.adopt(children)
 
         # Process events from the server.
         self.event_loop()
@@ -206,8 +239,7 @@ class WindowManager(EventHandler, PropertyManager):
             log.warning("Error framing window 0x%x.", window)
             return
         try:
-            client.establish_grabs(key_bindings=self.key_bindings,
-                                   button_bindings=self.button_bindings)
+            self.establish_client_grabs(client)
         except BadWindow:
             log.warning("Error establishing grabs for window 0x%x.", window)
             return
@@ -219,6 +251,10 @@ class WindowManager(EventHandler, PropertyManager):
         """Unmanage the given client."""
         log.debug("Unmanaging client window 0x%x.", client.window)
         del self.clients[client.window]
+        self.heads.invalidate_client_heads(client)
+        self.forget_children(client.window)
+        self.key_bindings.forget_grabs(client.frame)
+        self.button_bindings.forget_grabs(client.frame)
         try:
             del self.frames[client.frame]
         except KeyError:
@@ -257,7 +293,7 @@ class WindowManager(EventHandler, PropertyManager):
             return geometry.move(focus.frame_geometry + offset)
 
         # Center the window near the pointer position.
-        pointer = query_pointer(self.conn, self.screen)
+        pointer = self.pointer_position()
         if pointer:
             position = Position(max(0, pointer.x - geometry.width // 2),
                                 max(0, pointer.y - geometry.height // 2))
@@ -289,6 +325,83 @@ class WindowManager(EventHandler, PropertyManager):
                                border_width,
                                gravity)
 
+    def note_pointer_position(self, pointer):
+        """Record the current pointer position."""
+        self.pointer = pointer
+        self.pointer_time = default_timer()
+
+    def pointer_position(self, max_age=None):
+        """Return the last known pointer position. If that is older than
+        max_age seconds (default: pointer_max_age), query the server."""
+        if max_age is None:
+            max_age = self.pointer_max_age
+        if (self.pointer is None or
+            default_timer() - self.pointer_time > max_age):
+            self.note_pointer_position(query_pointer(self.conn, self.screen))
+        return self.pointer
+
+    def schedule(self, delay, function):
+        """Arrange for the given function to be called with no arguments from
+        the main event loop after at least delay seconds have elapsed.
+        Returns a timer that may be passed to cancel_timer."""
+        timer = [default_timer() + delay, next(self.timer_serial), function]
+        heappush(self.timers, timer)
+        return timer
+
+    def cancel_timer(self, timer):
+        """Cancel a timer returned by schedule, if it has not yet fired."""
+        # We just mark the entry as dead; it will be discarded when it
+        # reaches the top of the heap.
+        if timer:
+            timer[-1] = None
+
+    def run_timers(self):
+        """Call the functions of all expired timers. Returns the number of
+        seconds until the next timer will expire, 0 if any functions were
+        called, or None if no timers are pending."""
+        ran = False
+        while self.timers:
+            deadline, serial, function = self.timers[0]
+            if function is None:
+                heappop(self.timers)
+                continue
+            if deadline > default_timer():
+                return 0 if ran else deadline - default_timer()
+            heappop(self.timers)
+            function()
+            ran = True
+        return 0 if ran else None
+
+    def defer(self, function):
+        """Arrange for the given function to be called with no arguments from
+        the main event loop once all of the events generated by requests
+        issued before now have been received and processed."""
+        self.deferred.append(function)
+
+    def run_deferred(self):
+        """Call deferred functions whose fence has been passed. Returns true
+        if any were called or if new events may be pending."""
+        if self.fenced:
+            functions, self.fenced = self.fenced, []
+            for function in functions:
+                function()
+            return True
+        elif self.deferred:
+            # The server processes requests in order, so by the time the
+            # reply to this request arrives, all of the events generated
+            # by earlier requests will have been queued. This costs one
+            # round trip per pass through the event loop, no matter how
+            # many functions are waiting.
+            self.conn.core.GetInputFocus().reply()
+            self.fenced, self.deferred = self.deferred, []
+            return bool(self.get_pending_events()) or self.run_deferred()
+        return False
+
+    def focus_failed(self, client):
+        """Note that an attempt to focus the given client has failed."""
+        # Subclasses that deal with focus policy may want to try again.
+        pass
+
     def fullscreen_geometry(self, client):
         """Compute and return a fullscreen geometry for the given client."""
         return self.heads.client_head_geometry(client)
@@ -301,7 +414,57 @@ class WindowManager(EventHandler, PropertyManager):
             client = self.get_client(window)
             if client:
                 return client
-            window = self.conn.core.QueryTree(window).reply().parent
+            window = self.window_parent(window)
+
+    def window_parent(self, window):
+        """Return the parent of the given window.
+
+        We maintain a local model of the window tree from CreateNotify,
+        ReparentNotify, and DestroyNotify events (along with our own
+        requests), which covers the root's children, frames, clients,
+        and our widgets. For any other window (e.g., a subwindow of some
+        client) we ask the server for its ancestors up to the nearest
+        window in the model. If that window belongs to a client, we
+        remember the answers until the client is unmanaged; otherwise,
+        we don't."""
+        try:
+            return self.parents[window]
+        except KeyError:
+            pass
+        ancestry = []
+        ancestor = window
+        while ancestor not in self.parents:
+            try:
+                parent = self.conn.core.QueryTree(ancestor).reply().parent
+            except BadWindow:
+                return None
+            ancestry.append((ancestor, parent))
+            ancestor = parent
+        if self.get_client(ancestor):
+            for child, parent in ancestry:
+                self.parents[child] = parent
+                self.subwindows.setdefault(parent, set()).add(child)
+        return ancestry[0][1]
+
+    def forget_window(self, window):
+        """Remove the given window and any queried subwindows from our
+        model of the window tree."""
+        parent = self.parents.pop(window, None)
+        siblings = self.subwindows.get(parent)
+        if siblings:
+            siblings.discard(window)
+            if not siblings:
+                del self.subwindows[parent]
+        self.forget_children(window)
+
+    def forget_children(self, window):
+        """Forget the queried subwindows of the given window."""
+        # A client's queried subwindows are indexed by their parents,
+        # so we can discard them all when the client goes, even if we
+        # never hear about their destruction.
+        for child in self.subwindows.pop(window, ()):
+            self.parents.pop(child, None)
+            self.forget_children(child)
 
     def ensure_focus(self, client=None, time=Time.CurrentTime):
         """Make a best-effort attempt to ensure that some client has the
@@ -359,7 +522,17 @@ class WindowManager(EventHandler, PropertyManager):
                 except ExitWindowManager as e:
                     self.shutdown(*e.args)
                     return
-            select(rlist, wlist, xlist)
+            # Error handlers may issue new requests or generate new events,
+            # so we'll go around again before blocking if any were called.
+            if self.errors.check():
+                continue
+            # Likewise for deferred functions and timers.
+            if self.run_deferred():
+                continue
+            timeout = self.run_timers()
+            if timeout == 0:
+                continue
+            select(rlist, wlist, xlist, timeout)
 
     def get_pending_events(self):
         """Push all available events onto the event queue and return the queue.
@@ -400,6 +573,9 @@ class WindowManager(EventHandler, PropertyManager):
         """Handle an event from the server. If a handler is registered for
         the window the event was reported with respect to, dispatch the
         event to that handler."""
+        if (isinstance(event, self.pointer_event_types) and
+            event.root == self.screen.root):
+            self.note_pointer_position(Position(event.root_x, event.root_y))
         handler = self.window_handlers.get(event_window(event), None)
         if handler:
             try:
@@ -444,17 +620,56 @@ class WindowManager(EventHandler, PropertyManager):
                     w = self.parents.get(w, None)
         return self.clients.get(window, None)
 
+    def event_client(self, event):
+        """Return the client targeted by a bound key or button event.
+
+        Bindings are ordinarily grabbed on client frames, and so the event
+        window identifies the client. In global grabs mode, however, they
+        are grabbed on the root; a button event then targets the client
+        whose frame contains the pointer, and a key event the client with
+        the input focus."""
+        window = event_window(event)
+        if window != self.screen.root:
+            return self.get_client(window)
+        if isinstance(event, (ButtonPressEvent, ButtonReleaseEvent,
+                              MotionNotifyEvent)):
+            return self.get_client(event.child)
+        return self.current_focus
+
     def find_clients(self, test=lambda x: False):
         """Yield clients that satisfy the given test."""
         for client in self.clients.values():
             if test(client):
                 yield client
 
+    def establish_client_grabs(self, client):
+        """Establish passive grabs for the global bindings on a client's
+        frame. In global grabs mode, those are established just once, on
+        the root window, so clients need only establish their own."""
+        if self.global_grabs:
+            client.establish_grabs()
+        else:
+            client.establish_grabs(key_bindings=self.key_bindings,
+                                   button_bindings=self.button_bindings)
+
+    def update_global_grabs(self, focus=None):
+        """In global grabs mode, establish passive grabs for the global
+        bindings on the root window, unless the client that has (or is
+        about to receive) the focus has asked to be left alone."""
+        if not self.global_grabs:
+            return
+        if focus and not focus.global_bindings:
+            self.key_bindings.update_grabs(self.screen.root, frozenset())
+            self.button_bindings.update_grabs(self.screen.root, frozenset())
+        else:
+            self.key_bindings.establish_grabs(self.screen.root)
+            self.button_bindings.establish_grabs(self.screen.root)
+
     def update_for_changed_mapping(self):
         """Update for changed keyboard, modifier, or pointer mapping."""
+        self.update_global_grabs(self.current_focus)
         for client in self.clients.values():
-            client.establish_grabs(key_bindings=self.key_bindings,
-                                   button_bindings=self.button_bindings)
+            self.establish_client_grabs(client)
 
     @handler(ConfigureNotifyEvent)
     def handle_configure_notify(self, event):
@@ -465,6 +680,7 @@ class WindowManager(EventHandler, PropertyManager):
                                             event.width, event.height,
                                             event.border_width)
             log.debug("Root window geometry now %s.", self.screen_geometry)
+            self.heads.heads_changed()
 
     @handler(ConfigureRequestEvent)
     def handle_configure_request(self, event,
@@ -505,7 +721,7 @@ class WindowManager(EventHandler, PropertyManager):
     @handler(DestroyNotifyEvent)
     def handle_destroy_notify(self, event):
         log.debug("Window 0x%x destroyed.", event.window)
-        self.parents.pop(event.window, None)
+        self.forget_window(event.window)
         self.unregister_window_handler(event.window)
 
         client = self.get_client(event.window, True)
@@ -625,6 +841,16 @@ class WindowManager(EventHandler, PropertyManager):
 
     @handler((ButtonPressEvent, ButtonReleaseEvent))
     def handle_button_press(self, event):
+        if (isinstance(event, ButtonPressEvent) and
+            event.event == self.screen.root and
+            self.global_grabs):
+            # A client that has asked to be left alone gets the click
+            # instead of the global binding.
+            client = self.event_client(event)
+            if client and not client.global_bindings:
+                self.conn.core.AllowEvents(Allow.ReplayPointer, event.time)
+                return
+            self.conn.core.AllowEvents(Allow.AsyncPointer, event.time)
         try:
             action = self.button_bindings[event]
         except KeyError:
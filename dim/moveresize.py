@@ -2,6 +2,7 @@
 
 import logging
 from threading import Thread, Event as ThreadEvent
+from timeit import default_timer
 
 from xcb.xproto import *
 
@@ -347,6 +348,9 @@ class ClientUpdate(object):
         self.move_delta = move_delta
         self.geometry = client.absolute_geometry
         self.frame_geometry = client.frame_geometry
+        self.last_pointer = pointer
+        self.motion_count = 0
+        self.total_latency = self.max_latency = 0.0
         try:
             modifiers = next(client.manager.key_bindings.modsets(event.state))
         except AttributeError:
@@ -374,13 +378,31 @@ class ClientUpdate(object):
 
     def update(self, pointer):
         pass
-            
+
+    def note_latency(self, seconds):
+        """Record the time taken to process one motion step."""
+        self.motion_count += 1
+        self.total_latency += seconds
+        self.max_latency = max(self.max_latency, seconds)
+
+    def log_latency(self):
+        if not self.motion_count:
+            return
+        log.debug("Processed %d motion events in %s mode; "
+                  "latency mean %.3fms, max %.3fms.",
+                  self.motion_count,
+                  "hint" if self.client.manager.motion_hints else "full",
+                  1000 * self.total_latency / self.motion_count,
+                  1000 * self.max_latency)
+
     def commit(self, time=Time.CurrentTime):
+        self.log_latency()
         self.cleanup(time)
         self.client.decorator.message(None)
         self.client.conn.flush()
 
     def rollback(self, time=Time.CurrentTime):
+        self.log_latency()
         self.cleanup(time)
         self.client.decorator.message(None)
         self.client.conn.flush()
@@ -481,7 +503,11 @@ class ClientResize(ClientUpdate):
         self.change_cursor(self.cursors[self.gravity], time)
         self.geometry = self.client.absolute_geometry
         self.frame_geometry = self.client.frame_geometry
-        self.pointer = query_pointer(self.client.conn, self.client.screen)
+        # Without motion hints, every pointer motion is reported, and so
+        # the last position we saw is as good as asking the server.
+        self.pointer = (self.client.manager.pointer_position()
+                        if self.client.manager.motion_hints
+                        else self.last_pointer)
         self.update(self.pointer)
 
 class ClientRoll(ClientResize):
@@ -512,9 +538,19 @@ class MoveResize(WindowManager):
                          EventMask.ButtonMotion |
                          EventMask.PointerMotionHint)
 
-    def __init__(self, **kwargs):
+    def __init__(self, motion_hints=True, **kwargs):
         super(MoveResize, self).__init__(**kwargs)
 
+        # With motion hints, the server sends at most one motion event
+        # until we query the pointer position, costing a round trip per
+        # step. Without them, we receive every motion event, but rely on
+        # event compression to process only the most recent one.
+        self.motion_hints = motion_hints
+        self.grab_event_mask = (self.__grab_event_mask
+                                if motion_hints
+                                else (self.__grab_event_mask &
+                                      ~EventMask.PointerMotionHint))
+
         self.heads.register_change_handler(lambda *args: self.update_resistance)
 
     def constrain_position(self, client, position):
@@ -553,12 +589,14 @@ class MoveResize(WindowManager):
         self.client_update.resistance.reinitialize(self.client_update.client)
 
     def change_client_update_cursor(self, cursor, time=Time.CurrentTime):
+        # Every client update changes the cursor as soon as it begins,
+        # which also replaces the event mask of the passive grab.
         self.conn.core.ChangeActivePointerGrab(self.cursors[cursor], time,
-                                               self.__grab_event_mask)
+                                               self.grab_event_mask)
 
     def move_resize_window(self, event, update, **kwargs):
         assert isinstance(event, ButtonPressEvent)
-        client = self.get_client(event.event)
+        client = self.event_client(event)
         if not client or self.client_update:
             return
         self.conn.core.GrabKeyboard(False,
@@ -591,9 +629,16 @@ class MoveResize(WindowManager):
     def handle_motion_notify(self, event):
         if not self.client_update:
             return
-        self.client_update.update(query_pointer(self.conn, self.screen)
-                                  if event.detail == Motion.Hint
-                                  else Position(event.root_x, event.root_y))
+        start = default_timer()
+        if event.detail == Motion.Hint:
+            # Querying the pointer also re-arms motion hints.
+            pointer = query_pointer(self.conn, self.screen)
+            self.note_pointer_position(pointer)
+        else:
+            pointer = Position(event.root_x, event.root_y)
+        self.client_update.last_pointer = pointer
+        self.client_update.update(pointer)
+        self.client_update.note_latency(default_timer() - start)
 
     @handler((KeyPressEvent, KeyReleaseEvent,
               ButtonPressEvent, ButtonReleaseEvent))
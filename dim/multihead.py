@@ -4,6 +4,7 @@
 
 from __future__ import division
 
+from bisect import bisect_right
 import logging
 from struct import pack, unpack_from
 
@@ -15,7 +16,57 @@ import xcb.xinerama
 from event import EventHandler, handler
 from geometry import *
 from properties import WMState
-from xutil import query_extension, query_pointer
+from xutil import grab_server, query_extension
+
+class HeadIndex(object):
+    """An index over a set of head geometries supporting point location in
+    logarithmic time.
+
+    The screen is cut into vertical slabs at every distinct left and right
+    head edge, and each slab into cells at every distinct top and bottom
+    edge of the heads that span it. Locating a point is then a binary
+    search for its slab followed by one for its cell. Heads are assumed
+    to be few, so the quadratic construction cost is of no concern."""
+
+    def __init__(self, heads):
+        # Empty heads (e.g., disabled CRTCs) are ignored; the rest are
+        # ordered left-to-right, then top-to-bottom.
+        self.heads = tuple(sorted(set(head for head in heads if head),
+                                  key=lambda head: (head.x, head.y)))
+        self.positions = dict((head, i) for i, head in enumerate(self.heads))
+
+        self.xs = sorted(set(x
+                             for head in self.heads
+                             for x in (head.x, head.x + head.width)))
+        self.slabs = []
+        for x in self.xs[:-1]:
+            column = [head for head in self.heads
+                      if head.x <= x < head.x + head.width]
+            ys = sorted(set(y
+                            for head in column
+                            for y in (head.y, head.y + head.height)))
+            cells = [next((head for head in column
+                           if head.y <= y < head.y + head.height),
+                          None)
+                     for y in ys[:-1]]
+            self.slabs.append((ys, cells))
+
+    def __iter__(self):
+        return iter(self.heads)
+
+    def __len__(self):
+        return len(self.heads)
+
+    def locate(self, point):
+        """Return the head containing the given point, or None."""
+        i = bisect_right(self.xs, point.x) - 1
+        if not 0 <= i < len(self.slabs):
+            return None
+        ys, cells = self.slabs[i]
+        j = bisect_right(ys, point.y) - 1
+        if not 0 <= j < len(cells):
+            return None
+        return cells[j]
 
 class HeadManager(object):
     log = logging.getLogger("multihead")
@@ -42,6 +93,15 @@ class HeadManager(object):
         self.manager = manager
         self.change_handlers = set()
 
+        # Head assignments are cached, indexed by client. Each entry is a
+        # (frame geometry, head geometry) pair; the assignment is valid only
+        # as long as the client's frame geometry doesn't change.
+        self.client_heads = {}
+
+        # The head index is built on demand, and discarded whenever the
+        # head geometries change.
+        self._head_index = None
+
     def register_change_handler(self, handler):
         self.change_handlers.add(handler)
 
@@ -49,6 +109,7 @@ class HeadManager(object):
         self.change_handlers.discard(handler)
 
     def head_geometry_changed(self, old_geometry, new_geometry):
+        self.heads_changed()
         for handler in self.change_handlers:
             handler(old_geometry, new_geometry)
 
@@ -56,33 +117,64 @@ class HeadManager(object):
         """Return an iterator over the set of current head geometries."""
         return iter([self.manager.screen_geometry])
 
+    def heads_changed(self):
+        """Discard all state derived from the head geometries."""
+        self._head_index = None
+        self.invalidate_client_heads()
+
+    @property
+    def head_index(self):
+        if self._head_index is None:
+            self._head_index = HeadIndex(self)
+        return self._head_index
+
+    def invalidate_client_heads(self, client=None):
+        """Forget the cached head assignment of the given client, or of
+        all clients if none is given."""
+        if client is None:
+            self.client_heads.clear()
+        else:
+            self.client_heads.pop(client, None)
+
     def client_head_geometry(self, client):
         """Return the geometry of the head currently containing a client."""
         if not client or client.wm_state != WMState.NormalState:
             return None # not considered to be on any head
 
+        geometry = client.frame_geometry
+        try:
+            cached_geometry, head = self.client_heads[client]
+        except KeyError:
+            pass
+        else:
+            if cached_geometry == geometry:
+                return head
+        head = self.find_head_geometry(geometry)
+        self.client_heads[client] = (geometry, head)
+        return head
+
+    def find_head_geometry(self, geometry):
+        """Return the geometry of the head that contains the given
+        frame geometry."""
         # What counts as `containing a window'? We use a simple heuristic:
         # if there's a head that contains the midpoint of the visible portion
         # of the window, use that; otherwise, look for any non-trivial
         # intersection with the window.
-        geometry = client.frame_geometry
         visible = self.manager.screen_geometry & geometry
         if visible:
-            point = visible.midpoint()
-            for head in self:
-                if point in head:
-                    return head
-        for head in self:
+            head = self.head_index.locate(visible.midpoint())
+            if head:
+                return head
+        for head in self.head_index:
             if geometry & head:
                 return head
 
     @property
     def pointer_head_geometry(self):
         """Return the geometry of the head currently containing the pointer."""
-        pointer = query_pointer(self.conn, self.screen)
-        for head in self:
-            if pointer in head:
-                return head
+        head = self.head_index.locate(self.manager.pointer_position())
+        if head:
+            return head
         self.log.warning("Can't find head containing pointer.")
         return self.manager.screen_geometry
 
@@ -104,24 +196,87 @@ class HeadManager(object):
         cur_head = self.client_head_geometry(client)
         if not cur_head:
             return
-        heads = tuple(self)
+        index = self.head_index
+        heads = index.heads
         n = len(heads)
         if n < 2:
             return # no other head to switch to
         assert (0 < abs(incr) < n), "Bad increment %r" % incr
+        i = index.positions[cur_head]
+        offset = client.position() - cur_head.position()
         while True:
-            new_head = heads[(heads.index(cur_head) + incr) % n]
+            new_head = heads[(i + incr) % n]
             if new_head == cur_head:
                 return
-            new_position = (client.position() -
-                            cur_head.position() +
-                            new_head.position()) & new_head
-            if new_position or new_position == origin:
+            # The head-relative position is visible on the new head just
+            # when it lies within the new head's size.
+            if (0 <= offset.x < new_head.width and
+                0 <= offset.y < new_head.height):
+                new_position = new_head.position() + offset
                 break
             incr += 1 if incr > 0 else -1
         position = client.manager.constrain_position(client, new_position)
         client.configure_request(x=position.x, y=position.y)
 
+    def clients_on_head(self, head):
+        """Return a list of the clients (in any state) whose frames are
+        on the given head."""
+        if not head:
+            return []
+        return [client
+                for client in self.manager.clients.values()
+                if client.frame and
+                   self.find_head_geometry(client.frame_geometry) == head]
+
+    def relocate_geometry(self, geometry, old_head, new_head):
+        """Translate a frame geometry from one head to another, keeping
+        its head-relative position as far as the new head allows."""
+        position = (geometry.position() -
+                    old_head.position() +
+                    new_head.position())
+        size = geometry.size() + 2 * geometry.border_width
+        x = max(new_head.x,
+                min(position.x, new_head.x + new_head.width - size.width))
+        y = max(new_head.y,
+                min(position.y, new_head.y + new_head.height - size.height))
+        return geometry.move(Position(x, y))
+
+    def migrate_clients(self, clients, old_head, new_head):
+        """Move a batch of clients from a head that has changed geometry
+        or vanished to a new head. If no new head is given, the clients go
+        to the top-left-most remaining head."""
+        if not clients or not old_head:
+            return
+        self.heads_changed()
+        if not new_head:
+            new_head = next(iter(self.head_index), None)
+            if not new_head:
+                return
+        if new_head == old_head:
+            return
+        self.log.debug("Migrating %d clients from head %s to %s.",
+                       len(clients), old_head, new_head)
+        with grab_server(self.conn):
+            for client in clients:
+                self.migrate_client(client, old_head, new_head)
+
+    def migrate_client(self, client, old_head, new_head):
+        """Move one client from an old head to a new one, preserving any
+        fullscreen or maximized state."""
+        def relocate(geometry):
+            frame = client.absolute_to_frame_geometry(geometry)
+            frame = self.relocate_geometry(frame, old_head, new_head)
+            return client.frame_to_absolute_geometry(frame)
+        saved_geometry = getattr(client, "saved_geometry", None)
+        if saved_geometry:
+            client.saved_geometry = relocate(saved_geometry)
+        if client.is_fullscreen():
+            client.configure(new_head)
+            return
+        client.configure(relocate(client.absolute_geometry))
+        if client.is_maximized() and client.wm_state == WMState.NormalState:
+            client.maximize()
+
 class RandRManager(HeadManager, EventHandler):
     """Support multiple heads and root window geometry changes using the
     X Resize and Rotate extension."""
@@ -227,16 +382,20 @@ class RandRManager(HeadManager, EventHandler):
             cc = event.u.cc
             if cc.window != self.screen.root:
                 return
+            # Note which clients were on the old head before we lose track
+            # of it, so that we can move them all at once afterwards.
+            old_geometry = self.crtcs.get(cc.crtc)
+            clients = self.clients_on_head(old_geometry)
             if cc.mode:
                 new_geometry = Geometry(cc.x, cc.y, cc.width, cc.height, 0)
                 self.log.debug("CRTC %d changed: %s.", cc.crtc, new_geometry)
-                old_geometry = self.crtcs.get(cc.crtc)
                 self.crtcs[cc.crtc] = new_geometry
-                self.head_geometry_changed(old_geometry, new_geometry)
             else:
                 self.log.debug("CRTC %d disabled.", cc.crtc)
-                old_geometry = self.crtcs.pop(cc.crtc, None)
-                self.head_geometry_changed(old_geometry, None)
+                new_geometry = None
+                self.crtcs.pop(cc.crtc, None)
+            self.migrate_clients(clients, old_geometry, new_geometry)
+            self.head_geometry_changed(old_geometry, new_geometry)
 
 class XineramaManager(HeadManager):
     """Manage multiple heads using the Xinerama extension."""
@@ -10,11 +10,11 @@ class RaiseLower(WindowManager):
     """A window manager mixin that provides window raise & lower commands."""
 
     def raise_window(self, event):
-        client = self.get_client(event.event)
+        client = self.event_client(event)
         if client:
             client.configure(stack_mode=StackMode.TopIf)
 
     def lower_window(self, event):
-        client = self.get_client(event.event)
+        client = self.event_client(event)
         if client:
             client.configure(stack_mode=StackMode.BottomIf)
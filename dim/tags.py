@@ -10,6 +10,7 @@ great deal more flexibility."""
 from __future__ import unicode_literals
 
 from collections import defaultdict
+from functools import partial
 import logging
 import re
 
@@ -18,6 +19,7 @@ from xcb.xproto import *
 from atom import AtomCache
 from manager import WindowManager
 from properties import PropertyDescriptor, AtomList, WMState
+from xutil import grab_server
 
 __all__ = ["SpecSyntaxError", "parse_tagset_spec", "send_tagset_expr",
            "TagManager"]
@@ -27,6 +29,11 @@ log = logging.getLogger("tags")
 class TagMachineError(Exception):
     pass
 
+def freeze(instructions):
+    """Return a hashable version of an instruction sequence."""
+    return tuple(freeze(x) if isinstance(x, list) else x
+                 for x in instructions)
+
 class TagMachine(object):
     """A small virtual stack machine for operating on tagsets.
 
@@ -36,16 +43,35 @@ class TagMachine(object):
     manager might use atoms, whereas a test might use simple strings.
     Objects in the instruction stream that are not registered as opcodes
     are taken to be tagset names, the contents of which are implicitly
-    pushed onto the stack."""
+    pushed onto the stack.
+
+    Instruction sequences are compiled before they are run into lists of
+    thunks, which are cached. Quoted objects and lists are resolved at
+    compile time, as are references to the built-in opcodes; everything
+    else (tagsets and user-defined procedures) is looked up at run time."""
+
+    max_programs = 256 # maximum number of cached programs
 
     def __init__(self, clients, tagsets, opcodes={}, wild=None,
-                 default_tagset=lambda tag: []):
+                 default_tagset=lambda tag: [], change_states=None):
         self.clients = clients
         self.tagsets = tagsets
         self.opcodes = dict((code, getattr(self, name))
                             for code, name in opcodes.items())
+        self.builtins = dict(self.opcodes)
+        self.programs = {} # compiled programs, indexed by instruction tuple
+        self.assigned = set() # names of tagsets defined by assignment
+        self.procedures = {} # bodies of user-defined procedures, by name
+        self.assignments = 0 # number of assignments run
+        self.redefined = set() # names assigned by the current sequence
+        self.instructions = () # the instruction sequence being run
+        self.view = None # the last instruction sequence that did a show
+        self.showed = False # did the current instruction sequence show?
+        self.shown = set() # the clients it showed
         self.wild = wild
         self.default_tagset = default_tagset
+        if change_states:
+            self.change_states = change_states
 
         self.ip = iter([])
         self.stack = []
@@ -55,14 +81,54 @@ class TagMachine(object):
     def tagset(self, tag):
         self.push(self.tagsets.get(tag) or set(self.default_tagset(tag)))
 
-    def run(self, instructions):
-        self.ip = iter(instructions)
-        for x in self.ip:
-            op = self.opcodes.get(x, None)
-            if op:
-                op()
+    def reference(self, x):
+        """Execute a procedure or push a tagset."""
+        op = self.opcodes.get(x, None)
+        if op:
+            op()
+        else:
+            self.tagset(x)
+
+    def compile(self, instructions):
+        """Compile a sequence of instructions and return a program, which
+        is a list of functions of no arguments."""
+        key = freeze(instructions)
+        try:
+            return self.programs[key]
+        except KeyError:
+            pass
+        program = []
+        ip = iter(instructions)
+        for x in ip:
+            if isinstance(x, list):
+                # A list collected by begin, e.g., in a procedure body.
+                program.append(partial(self.push, x))
+                continue
+            op = self.builtins.get(x, None)
+            if op and self.opcodes.get(x, None) != op:
+                op = None # shadowed by an assignment
+            if op == self.quote:
+                program.append(partial(self.push, next(ip)))
+            elif op == self.begin:
+                program.append(partial(self.push, self.collect(ip)))
+            elif op:
+                program.append(op)
             else:
-                self.tagset(x)
+                program.append(partial(self.reference, x))
+        if len(self.programs) >= self.max_programs:
+            self.programs.clear()
+        self.programs[key] = program
+        return program
+
+    def execute(self, program):
+        for step in program:
+            step()
+
+    def run(self, instructions):
+        self.instructions = instructions
+        self.showed = False
+        self.redefined = set()
+        self.execute(self.compile(instructions))
         if self.stack:
             log.debug("Tagset stack: %r.", self.stack)
 
@@ -88,17 +154,21 @@ class TagMachine(object):
     def begin(self):
         """Pull instructions off the instruction stream until a matching end
         is found, and push a list containing the instructions so collected."""
+        self.push(self.collect(self.ip))
+
+    def collect(self, ip):
+        """Pull instructions from the given iterator until a matching end
+        is found, and return a list of the instructions so collected."""
         l = []
         while True:
-            x = next(self.ip)
+            x = next(ip)
             op = self.opcodes.get(x, None)
             if op == self.end:
                 break
             elif op == self.begin:
-                self.begin()
-                x = self.pop()
+                x = self.collect(ip)
             l.append(x)
-        self.push(l)
+        return l
 
     def end(self):
         # List endings are actually handled in begin.
@@ -107,16 +177,26 @@ class TagMachine(object):
     def assign(self):
         value = self.pop()
         name = self.pop()
+        self.assignments += 1
+        self.redefined.add(name)
+        if name in self.builtins:
+            # Compiled programs may refer to the old definition.
+            self.programs.clear()
         if isinstance(value, set):
             # Tagset assignment.
             self.opcodes.pop(name, None)
             self.tagsets[name] = set(value)
+            self.assigned.add(name)
+            self.procedures.pop(name, None)
             self.tagset(name)
         elif isinstance(value, list):
             # Procedure assignment.
             self.tagsets.pop(name, None)
-            self.opcodes[name] = lambda: self.run(value)
-            self.run(value)
+            self.assigned.discard(name)
+            self.procedures[name] = value
+            program = self.compile(value)
+            self.opcodes[name] = partial(self.execute, program)
+            self.execute(program)
         else:
             raise TagMachineError("invalid assignment")
 
@@ -139,13 +219,25 @@ class TagMachine(object):
         if self.wild:
             self.push(self.tagsets.get(self.wild, set()))
             self.union()
+        self.shown = self.stack[-1]
         self.dup()
         self.complement()
-        for client in self.pop():
+        # Only touch the clients whose state actually needs to change.
+        hide = set(client for client in self.pop()
+                   if client.wm_state != WMState.IconicState)
+        show = set(client for client in self.pop()
+                   if client.wm_state != WMState.NormalState)
+        self.change_states(show, hide)
+        self.clear()
+        self.view = self.instructions
+        self.showed = True
+
+    def change_states(self, normalize, iconify):
+        """Iconify and normalize the given sets of clients."""
+        for client in iconify:
             client.iconify()
-        for client in self.pop():
+        for client in normalize:
             client.normalize()
-        self.clear()
 
     def all_tags(self):
         self.push(reduce(set.union, self.tagsets.values(), set()))
@@ -161,6 +253,129 @@ class TagMachine(object):
                       for client in self.clients.values()
                       if client.wm_state == WMState.NormalState))
 
+class ClientTagMachine(TagMachine):
+    """A tag machine that re-evaluates the last view shown by another machine
+    for a single client, by restricting every set it operates on to just
+    that client. Running the view on such a machine therefore shows or
+    hides only the given client, at a cost that depends on the length of
+    the view's instruction sequence, but not on the number of clients or
+    tags. Procedures are those defined by the given machine; they are
+    recompiled whenever it has run an assignment since the last update.
+
+    By default, the view is the last one shown by the given machine, and
+    state changes are performed by that machine's change_states method;
+    either may be overridden."""
+
+    def __init__(self, machine, view=None, change_states=None):
+        super(ClientTagMachine, self).__init__({}, {})
+        self.machine = machine
+        self.default_tagset = machine.default_tagset
+        self.change_states = change_states or machine.change_states
+        self.opcodes = dict((code, getattr(self, op.__name__))
+                            for code, op in machine.builtins.items())
+        self.builtins = dict(self.opcodes)
+        self.view = machine.view if view is None else view
+        self.client = None
+        self.loaded = None # the machine's assignment count at last load
+        self.names = None # tagsets the view refers to (None for all)
+        self.open = True # may the view include clients in none of them?
+
+    def load_procedures(self):
+        """Compile the procedures currently defined by the machine."""
+        self.opcodes = dict(self.builtins)
+        for name in self.machine.assigned:
+            self.opcodes.pop(name, None)
+        self.programs.clear()
+        for name, body in self.machine.procedures.items():
+            self.opcodes[name] = partial(self.execute, self.compile(body))
+        self.loaded = self.machine.assignments
+        self.find_references()
+
+    def find_references(self):
+        """Find the names of the tagsets that the view refers to, directly
+        or through the machine's procedures, and note whether it may include
+        clients that belong to none of them."""
+        names = set([self.machine.wild])
+        self.open = False
+        seen = set()
+        pending = [self.view or []]
+        while pending:
+            for x in pending.pop():
+                if isinstance(x, list):
+                    pending.append(x)
+                elif x in self.machine.procedures:
+                    if x not in seen:
+                        seen.add(x)
+                        pending.append(self.machine.procedures[x])
+                elif x not in self.opcodes:
+                    names.add(x)
+                elif self.opcodes[x] == self.all_tags:
+                    self.names, self.open = None, True
+                    return
+                elif self.opcodes[x] in (self.complement,
+                                         self.all_clients,
+                                         self.current_set):
+                    self.open = True
+        self.names = frozenset(names)
+
+    def depends_on(self, tags, new=False):
+        """Return true if a client's membership in the view might depend on
+        the given tags: those of the client that have changed, or all of its
+        tags if the client is new."""
+        if self.loaded != self.machine.assignments:
+            self.load_procedures()
+        return (self.names is None or
+                not self.names.isdisjoint(tags) or
+                (new and self.open))
+
+    def update(self, client):
+        """Re-evaluate the view for the given client."""
+        if self.loaded != self.machine.assignments:
+            self.load_procedures()
+        self.client = client
+        self.tagsets.clear()
+        self.assigned.clear()
+        self.shown = set()
+        del self.stack[:]
+        self.run(self.view)
+
+    def member(self, client):
+        """Return true if the given client belongs to the view."""
+        self.update(client)
+        return client in self.shown
+
+    def restrict(self, clients):
+        return set([self.client]) if self.client in clients else set()
+
+    def tagset(self, tag):
+        if tag in self.tagsets:
+            self.push(self.tagsets[tag])
+        else:
+            self.push(self.restrict(self.machine.tagsets.get(tag) or
+                                    self.default_tagset(tag)))
+
+    def show(self):
+        if self.machine.wild:
+            self.push(self.restrict(self.machine.tagsets.get(self.machine.wild,
+                                                             ())))
+            self.union()
+        super(ClientTagMachine, self).show()
+
+    def all_tags(self):
+        self.push(set([self.client])
+                  if any(self.client in tagset
+                         for tagset in (self.machine.tagsets.values() +
+                                        self.tagsets.values()))
+                  else set())
+
+    def all_clients(self):
+        self.push(set([self.client]))
+
+    def current_set(self):
+        self.push(set([self.client])
+                  if self.client.wm_state == WMState.NormalState
+                  else set())
+
 # Sequences of tag machine instructions will generally be given by the
 # user in the form of infix expressions we call tagset specifications.
 # They are tokenized, parsed, converted to postfix, and then encoded
@@ -455,65 +670,102 @@ class SpecParser(object):
         else:
             raise SpecSyntaxError("unexpected token '%s'" % (self.token,))
 
-def parse_tagset_spec(spec):
+parsed_specs = {} # cache for parse_tagset_spec, indexed by spec
+
+def parse_tagset_spec(spec, max_cached=256):
     """Tokenize and parse a tagset specification."""
-    return SpecParser().parse(tokenize(spec)).postfix()
-
-def intern_tagset_expr(conn, expr, atoms=None,
-                       aliases={"*": "_DIM_ALL_TAGS",
-                                ".": "_DIM_CURRENT_SET",
-                                "∅": "_DIM_EMPTY_SET",
-                                "0": "_DIM_EMPTY_SET"}):
-    def intern(x, atoms=atoms or AtomCache(conn)):
-        return atoms.intern(x.atom
-                            if isinstance(x, OpToken)
-                            else aliases.get(x, x),
-                            "UTF-8")
-    return map(intern, expr)
-
-def send_tagset_expr(conn, expr, show=True, screen=None, atoms=None):
+    try:
+        expr = parsed_specs[spec]
+    except KeyError:
+        expr = SpecParser().parse(tokenize(spec)).postfix()
+        if len(parsed_specs) >= max_cached:
+            parsed_specs.clear()
+        parsed_specs[spec] = expr
+    return list(expr) # callers may modify the result
+
+# The opcodes of the tag machine, as atom names.
+tag_machine_opcodes = {None: "nop",
+                       "_DIM_TAGSET_BEGIN": "begin",
+                       "_DIM_TAGSET_END": "end",
+                       "_DIM_TAGSET_QUOTE": "quote",
+                       "_DIM_TAGSET_ASSIGN": "assign",
+                       "_DIM_TAGSET_UNION": "union",
+                       "_DIM_TAGSET_INTERSECTION": "intersection",
+                       "_DIM_TAGSET_DIFFERENCE": "difference",
+                       "_DIM_TAGSET_COMPLEMENT": "complement",
+                       "_DIM_TAGSET_SHOW": "show",
+                       "_DIM_ALL_TAGS": "all_tags",
+                       "_DIM_EMPTY_SET": "empty_set",
+                       "_DIM_CURRENT_SET": "current_set"}
+
+def tagset_expr_names(expr,
+                      aliases={"*": "_DIM_ALL_TAGS",
+                               ".": "_DIM_CURRENT_SET",
+                               "∅": "_DIM_EMPTY_SET",
+                               "0": "_DIM_EMPTY_SET"}):
+    """Return the atom names that encode a parsed tagset specification."""
+    return [x.atom if isinstance(x, OpToken) else aliases.get(x, x)
+            for x in expr]
+
+def intern_tagset_expr(conn, expr, atoms=None):
+    """Encode a tag machine expression as a list of atoms. Any names not
+    already in the atom cache are interned with a single batch of requests,
+    so this costs at most one round trip."""
+    atoms = atoms or AtomCache(conn)
+    names = tagset_expr_names(expr)
+    atoms.prime_cache(set(name for name in names
+                          if name not in atoms.atoms),
+                      "UTF-8")
+    return [atoms.intern(name, "UTF-8") for name in names]
+
+def send_tagset_expr(conn, expr, show=True, screen=None, atoms=None,
+                     check=True):
     """Given a tag machine expression, encode it as a list of atoms and
-    send it to the window manager via a property on the root window."""
+    send it to the window manager via a property on the root window.
+    If check is false, the property change is neither checked nor flushed,
+    so that a caller sending a stream of expressions need not wait for each
+    one to complete."""
     assert conn
     atoms = atoms or AtomCache(conn)
     if show: expr += ["_DIM_TAGSET_SHOW"]
-    expr = intern_tagset_expr(conn, expr, atoms)
+    # Intern the property name and type along with the expression.
+    expr = intern_tagset_expr(conn, expr + ["_DIM_TAGSET_EXPR", "ATOM"], atoms)
+    expr, property, type = expr[:-2], expr[-2], expr[-1]
     screen = conn.pref_screen if screen is None else screen
     root = conn.get_setup().roots[screen].root
-    conn.core.ChangePropertyChecked(PropMode.Replace,
-                                    root,
-                                    atoms.intern("_DIM_TAGSET_EXPR"),
-                                    atoms.intern("ATOM"),
-                                    *AtomList(expr).change_property_args()).check()
+    args = ((PropMode.Replace, root, property, type) +
+            AtomList(expr).change_property_args())
+    if check:
+        conn.core.ChangePropertyChecked(*args).check()
+    else:
+        conn.core.ChangeProperty(*args)
 
 # Finally, we have a manager class that maintains the tagsets and tag machine.
 
 class TagManager(WindowManager):
     tagset_expr = PropertyDescriptor("_DIM_TAGSET_EXPR", AtomList, [])
 
-    def __init__(self, **kwargs):
+    max_views = 16 # maximum length of the view history
+
+    def __init__(self, live_tagsets=False, **kwargs):
         super(TagManager, self).__init__(**kwargs)
 
+        self.live_tagsets = live_tagsets # re-evaluate views on tag changes?
+        self.view_machine = None # for incremental updates of the live view
+        self.views = [] # recently shown views, as (machine, clients) pairs
+        self.view_index = -1 # position of the current view in the history
         self.tagsets = defaultdict(set) # sets of clients, indexed by tag
-        opcodes = {None: "nop",
-                   "_DIM_TAGSET_BEGIN": "begin",
-                   "_DIM_TAGSET_END": "end",
-                   "_DIM_TAGSET_QUOTE": "quote",
-                   "_DIM_TAGSET_ASSIGN": "assign",
-                   "_DIM_TAGSET_UNION": "union",
-                   "_DIM_TAGSET_INTERSECTION": "intersection",
-                   "_DIM_TAGSET_DIFFERENCE": "difference",
-                   "_DIM_TAGSET_COMPLEMENT": "complement",
-                   "_DIM_TAGSET_SHOW": "show",
-                   "_DIM_ALL_TAGS": "all_tags",
-                   "_DIM_EMPTY_SET": "empty_set",
-                   "_DIM_CURRENT_SET": "current_set"}
+        self.class_tagsets = defaultdict(set) # implicit tagsets (WM_CLASS)
+        self.class_tags = {} # implicit tags, indexed by client
+        self.client_tags = {} # explicit tags, indexed by client
+        opcodes = tag_machine_opcodes
         self.atoms.prime_cache(list(opcodes.keys()) + ["*"])
         self.tag_machine = TagMachine(self.clients, self.tagsets,
                                       dict((self.atoms[code], name)
                                            for code, name in opcodes.items()),
                                       wild=self.atoms["*"],
-                                      default_tagset=self.default_tagset)
+                                      default_tagset=self.default_tagset,
+                                      change_states=self.change_states)
         self.register_property_change_handler("_DIM_TAGSET_EXPR",
                                               self.tagset_expr_changed)
 
@@ -521,19 +773,33 @@ class TagManager(WindowManager):
         super(TagManager, self).shutdown(*args)
         for tagset in self.tagsets.values():
             assert not tagset
+        assert not self.class_tagsets
+        assert not self.client_tags
 
     def manage(self, window, adopted=False):
         client = super(TagManager, self).manage(window, adopted)
         if client:
             self.note_tags(client)
+            self.note_class(client)
+            self.update_views(client,
+                              (self.client_tags.get(client, frozenset()) |
+                               self.class_tags[client]),
+                              new=True)
             client.register_property_change_handler("_DIM_TAGS",
                                                     self.tags_changed)
+            client.register_property_change_handler("WM_CLASS",
+                                                    self.class_changed)
         return client
 
     def unmanage(self, client, **kwargs):
         self.forget_tags(client)
+        self.forget_class(client)
+        for machine, clients in self.views:
+            clients.discard(client)
         client.unregister_property_change_handler("_DIM_TAGS",
                                                   self.tags_changed)
+        client.unregister_property_change_handler("WM_CLASS",
+                                                  self.class_changed)
         super(TagManager, self).unmanage(client, **kwargs)
 
     def change_state(self, client, initial, final):
@@ -575,37 +841,197 @@ class TagManager(WindowManager):
               not self.tagsets.get(self.tagset_expr[0])):
             return [self.tagset_expr[0]]
 
+    def change_states(self, normalize, iconify):
+        """Iconify and normalize the given sets of clients, with all of the
+        resulting map and unmap requests issued under a single server grab."""
+        log.debug("Showing %d clients, hiding %d.",
+                  len(normalize), len(iconify))
+        with grab_server(self.conn):
+            for client in iconify:
+                client.iconify()
+            for client in normalize:
+                client.normalize()
+
     def default_tagset(self, tag):
-        """Yield client for the given tag, which does not name a tagset.
+        """Return the clients for the given tag, which does not name a tagset.
         We treat the client's class and instance names (ICCCM §4.1.2.5)
         as implicit tags."""
-        for client in self.clients.values():
-            if any(x and self.atoms.intern(x, "UTF-8") == tag
-                   for x in client.wm_class):
-                yield client
+        return self.class_tagsets.get(tag, ())
+
+    def note_class(self, client):
+        """Index the client by its class and instance names, which are
+        interned once here rather than on every implicit tagset lookup."""
+        tags = frozenset(self.atoms.intern(x, "UTF-8")
+                         for x in client.wm_class if x)
+        self.class_tags[client] = tags
+        for tag in tags:
+            self.class_tagsets[tag].add(client)
+
+    def forget_class(self, client):
+        for tag in self.class_tags.pop(client, ()):
+            tagset = self.class_tagsets[tag]
+            tagset.discard(client)
+            if not tagset:
+                del self.class_tagsets[tag]
 
-    def note_tags(self, client):
-        for tag in client.dim_tags:
+    def class_changed(self, window, name, deleted, time):
+        client = self.get_client(window, True)
+        old_tags = self.class_tags.get(client, frozenset())
+        self.forget_class(client)
+        if not deleted:
+            self.note_class(client)
+        self.update_view(client,
+                         old_tags ^ self.class_tags.get(client, frozenset()),
+                         time)
+
+    def note_tags(self, client, tags=None):
+        """Update the tagsets to reflect the client's current tags. Only the
+        tagsets for tags that were added or removed since the last update
+        are touched; tagsets that become empty are discarded, unless they
+        were defined by an assignment in the tag machine. Returns the set
+        of tags that were added or removed."""
+        old_tags = self.client_tags.pop(client, frozenset())
+        new_tags = frozenset(client.dim_tags if tags is None else tags)
+        if new_tags:
+            self.client_tags[client] = new_tags
+        for tag in old_tags - new_tags:
+            log.debug("Removing client window 0x%x from tagset %s.",
+                      client.window, self.atoms.name(tag, "UTF-8"))
+            tagset = self.tagsets.get(tag)
+            if tagset is not None:
+                tagset.discard(client)
+                if not tagset and tag not in self.tag_machine.assigned:
+                    del self.tagsets[tag]
+        for tag in new_tags - old_tags:
             log.debug("Adding client window 0x%x to tagset %s.",
                       client.window, self.atoms.name(tag, "UTF-8"))
             self.tagsets[tag].add(client)
+        return old_tags ^ new_tags
 
     def forget_tags(self, client):
-        for tagset in self.tagsets.values():
-            tagset.discard(client)
+        self.note_tags(client, ())
+        for tag in self.tag_machine.assigned:
+            tagset = self.tagsets.get(tag)
+            if tagset:
+                tagset.discard(client)
 
     def tags_changed(self, window, name, deleted, time):
         client = self.get_client(window, True)
-        self.forget_tags(client)
-        if not deleted:
-            self.note_tags(client)
+        tags = self.note_tags(client, () if deleted else None)
+        self.update_view(client, tags, time)
+
+    def update_view(self, client, tags, time=Time.CurrentTime):
+        """Note that the given tags of the client have changed. If live
+        tagsets are enabled, show or hide the client according to the last
+        tagset expression shown."""
+        self.update_views(client, tags)
+        if (not self.view_machine or
+            client.wm_state == WMState.WithdrawnState):
+            return
+        try:
+            self.view_machine.update(client)
+        except IndexError:
+            log.warning("Stack underflow while updating tagset view.")
+        self.ensure_focus(time=time)
+
+    def run_tagset_expr(self, expr):
+        """Run a tagset expression, and note the view it shows, if any."""
+        try:
+            self.tag_machine.run(expr)
+        finally:
+            showed = self.tag_machine.showed
+            if self.tag_machine.redefined:
+                self.definitions_changed(self.tag_machine.redefined, showed)
+            if showed:
+                self.note_view()
+
+    def definitions_changed(self, names, showed=False):
+        """Recompute the membership of the historical views that depend on
+        any of the given names, which have just been assigned. If live
+        tagsets are enabled and the current view depends on them, too,
+        show it again over all clients, unless a view was just shown."""
+        for i, (machine, clients) in enumerate(self.views):
+            if machine.depends_on(names):
+                self.views[i] = (machine, self.view_members(machine))
+        if (self.view_machine and
+            self.view_machine.depends_on(names) and
+            not showed):
+            log.debug("Re-showing the current view for new definitions.")
+            try:
+                self.tag_machine.run(self.view_machine.view)
+            except IndexError:
+                log.warning("Stack underflow while showing tagset view.")
+
+    def view_members(self, machine):
+        """Return the set of clients that belong to the given view."""
+        members = set()
+        for client in self.clients.values():
+            try:
+                if machine.member(client):
+                    members.add(client)
+            except IndexError:
+                pass
+        return members
+
+    def note_view(self):
+        """Record the view just shown by the tag machine in the history,
+        discarding any views after the current one."""
+        del self.views[self.view_index + 1:]
+        self.views.append((ClientTagMachine(self.tag_machine,
+                                            change_states=lambda *args: None),
+                           set(self.tag_machine.shown)))
+        del self.views[:-self.max_views]
+        self.view_index = len(self.views) - 1
+        if self.live_tagsets:
+            self.view_machine = ClientTagMachine(self.tag_machine)
+
+    def update_views(self, client, tags, new=False):
+        """Update the cached membership of the historical views for the
+        given client, whose given tags have changed; for a new client,
+        those are all of its tags. Only the views whose membership might
+        depend on those tags are re-evaluated."""
+        for machine, clients in self.views:
+            if not machine.depends_on(tags, new):
+                continue
+            try:
+                member = machine.member(client)
+            except IndexError:
+                member = False
+            if member:
+                clients.add(client)
+            else:
+                clients.discard(client)
+
+    def show_view(self, index, time=Time.CurrentTime):
+        """Show the view at the given position in the history, using its
+        cached membership."""
+        if not 0 <= index < len(self.views):
+            return
+        machine, clients = self.views[index]
+        self.view_index = index
+        hide = set(client for client in self.clients.values()
+                   if client not in clients and
+                      client.wm_state != WMState.IconicState)
+        show = set(client for client in clients
+                   if client.wm_state != WMState.NormalState)
+        self.change_states(show, hide)
+        if self.live_tagsets:
+            self.view_machine = ClientTagMachine(self.tag_machine,
+                                                 view=machine.view)
+        self.ensure_focus(time=time)
+
+    def show_previous_view(self, time=Time.CurrentTime):
+        self.show_view(self.view_index - 1, time)
+
+    def show_next_view(self, time=Time.CurrentTime):
+        self.show_view(self.view_index + 1, time)
 
     def tagset_expr_changed(self, window, name, deleted, time):
         assert window == self.screen.root
         if deleted:
             return
         try:
-            self.tag_machine.run(self.tagset_expr)
+            self.run_tagset_expr(self.tagset_expr)
         except IndexError:
             log.warning("Stack underflow while evaluating tagset expression.")
         self.ensure_focus(time=time)
@@ -614,5 +1040,5 @@ class TagManager(WindowManager):
         """Parse and execute a tagset specification directly.
         Does not use or set the _DIM_TAGSET_EXPR property."""
         expr = parse_tagset_spec(spec) + (["_DIM_TAGSET_SHOW"] if show else [])
-        self.tag_machine.run(intern_tagset_expr(self.conn, expr,
+        self.run_tagset_expr(intern_tagset_expr(self.conn, expr,
                                                 atoms=self.atoms))
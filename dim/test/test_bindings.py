@@ -140,6 +140,32 @@ class TestBindings(unittest.TestCase):
         self.assertKeyBinding(XK_c, ModMask.Control | meta, "C-A-c")
         self.assertKeyBinding(XK_percent, ModMask.Control | alt, None)
 
+    def test_compiled_lookup(self):
+        self.bindings = KeyBindings({("control", "a"): "C-a"},
+                                    self.keymap,
+                                    self.modmap)
+        keycode = self.keymap.keysym_to_keycode(XK_a)
+        self.assertEqual(self.bindings.lookup(keycode, ModMask.Control, True),
+                         "C-a")
+        self.assertTrue((keycode, ModMask.Control, True)
+                        in self.bindings.table)
+        self.assertRaises(KeyError,
+                          lambda: self.bindings.lookup(keycode, 0, True))
+        self.assertTrue((keycode, 0, True) in self.bindings.table)
+
+        # A change in the mapping should flush the table.
+        self.keymap.serial += 1
+        self.assertRaises(KeyError,
+                          lambda: self.bindings.lookup(keycode, 0, False))
+        self.assertEqual(len(self.bindings.table), 1)
+
+        # So should a change in the bindings map.
+        self.bindings.bindings[(frozenset(), XK_a, True)] = "a"
+        self.assertEqual(self.bindings.lookup(keycode, 0, True), "a")
+        del self.bindings.bindings[(frozenset(), XK_a, True)]
+        self.assertRaises(KeyError,
+                          lambda: self.bindings.lookup(keycode, 0, True))
+
     def test_button_bindings(self):
         self.bindings = ButtonBindings({1: "button-1",
                                         ("control", 1): "C-button-1",
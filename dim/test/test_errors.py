@@ -0,0 +1,113 @@
+# -*- mode: Python; coding: utf-8 -*-
+
+import unittest
+
+import xcb
+from xcb.xproto import *
+
+from dim.errors import ErrorDispatcher
+
+class TestErrorDispatcher(unittest.TestCase):
+    def setUp(self):
+        self.conn = xcb.connect()
+        self.screen = self.conn.get_setup().roots[self.conn.pref_screen]
+        self.errors = ErrorDispatcher(self.conn)
+
+    def tearDown(self):
+        self.conn.disconnect()
+
+    def good_request(self):
+        """Issue a checked request that will succeed."""
+        window = self.conn.generate_id()
+        return self.conn.core.CreateWindowChecked(self.screen.root_depth,
+                                                  window, self.screen.root,
+                                                  0, 0, 1, 1, 0,
+                                                  WindowClass.InputOutput,
+                                                  self.screen.root_visual,
+                                                  0, [])
+
+    def bad_request(self):
+        """Issue a checked request that will fail with a BadWindow error."""
+        return self.conn.core.MapWindowChecked(0)
+
+    def test_register(self):
+        """Error dispatcher registration"""
+        cookie = self.good_request()
+        self.assertTrue(self.errors.register(cookie) is cookie)
+        self.assertEqual(len(self.errors), 1)
+        self.assertEqual(self.errors.check(), 0)
+        self.assertEqual(len(self.errors), 0)
+        self.assertEqual(self.errors.check(), 0)
+
+    def test_handlers(self):
+        """Error dispatcher handlers run in request order"""
+        handled = []
+        self.errors.register(self.bad_request(),
+                             lambda error: handled.append((1, error)))
+        self.errors.register(self.good_request(),
+                             lambda error: handled.append((2, error)))
+        self.errors.register(self.bad_request(),
+                             lambda error: handled.append((3, error)))
+        self.assertEqual(self.errors.check(), 2)
+        self.assertEqual([i for i, error in handled], [1, 3])
+        self.assertTrue(all(isinstance(error, BadWindow)
+                            for i, error in handled))
+
+    def test_failing_handler(self):
+        """Error dispatcher isolates failing handlers"""
+        handled = []
+        def reraise(error):
+            raise error
+        self.errors.register(self.bad_request(), reraise)
+        self.errors.register(self.bad_request(), handled.append)
+        self.assertEqual(self.errors.check(), 2)
+        self.assertEqual(len(handled), 1)
+
+    def test_batch_order(self):
+        """Error dispatcher checks the latest request first"""
+        # Once the latest request is known to have been processed, so are
+        # all the earlier ones; checking it first costs the whole batch at
+        # most one round trip.
+        checked = []
+        class Cookie(object):
+            def __init__(self, i, cookie):
+                self.i, self.cookie = i, cookie
+            def check(self):
+                checked.append(self.i)
+                self.cookie.check()
+        for i in range(3):
+            self.errors.register(Cookie(i, self.good_request()))
+        self.assertEqual(self.errors.check(), 0)
+        self.assertEqual(checked, [2, 1, 0])
+
+    def test_check_cookie(self):
+        """Error dispatcher checks a single request"""
+        handled = []
+        first = self.errors.register(self.bad_request(),
+                                     lambda error: handled.append(1))
+        second = self.errors.register(self.bad_request(),
+                                      lambda error: handled.append(2))
+        self.assertEqual(self.errors.check(second), 1)
+        self.assertEqual(handled, [2])
+        self.assertEqual(len(self.errors), 1)
+        self.assertEqual(self.errors.check(second), 0)
+        self.assertEqual(self.errors.check(), 1)
+        self.assertEqual(handled, [2, 1])
+
+    def test_reentrant_check(self):
+        """Error dispatcher handlers may check new requests"""
+        # This is what a failed focus offer does: the handler continues
+        # the focus search, which may issue and check further requests.
+        handled = []
+        def retry(error):
+            handled.append(error)
+            cookie = self.errors.register(self.bad_request(), handled.append)
+            self.assertEqual(self.errors.check(cookie), 1)
+        self.errors.register(self.bad_request(), retry)
+        self.errors.register(self.bad_request(), handled.append)
+        self.assertEqual(self.errors.check(), 2)
+        self.assertEqual(len(handled), 3)
+        self.assertEqual(len(self.errors), 0)
+
+if __name__ == "__main__":
+    unittest.main()
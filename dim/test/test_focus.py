@@ -9,12 +9,14 @@
 # focus seriously, and our implementation owes it a debt of gratitude.
 
 from time import sleep
+from timeit import default_timer
 import unittest
 
 from dim.event import *
 from dim.geometry import *
 from dim.focus import *
 from dim.properties import WMHints
+from dim.xutil import grab_server
 
 from xcb.xproto import *
 
@@ -24,6 +26,41 @@ def center(geometry):
     bw = geometry.border_width
     return geometry.position() + geometry.size() // 2 + Position(bw, bw)
 
+class TestFocusList(unittest.TestCase):
+    def test_mru_order(self):
+        """Focus list order"""
+        focus_list = FocusList([1, 2, 3])
+        self.assertEqual(list(focus_list), [1, 2, 3])
+        self.assertEqual(focus_list[0], 1)
+        focus_list.appendleft(3)
+        self.assertEqual(list(focus_list), [3, 1, 2])
+        focus_list.appendleft(4)
+        self.assertEqual(list(focus_list), [4, 3, 1, 2])
+        self.assertEqual(len(focus_list), 4)
+
+    def test_remove(self):
+        """Focus list removal"""
+        focus_list = FocusList([1, 2, 3])
+        focus_list.remove(2)
+        self.assertFalse(2 in focus_list)
+        self.assertRaises(ValueError, lambda: focus_list.remove(2))
+        focus_list.discard(2)
+        focus_list.discard(1)
+        self.assertEqual(list(focus_list), [3])
+        focus_list.remove(3)
+        self.assertFalse(focus_list)
+        self.assertRaises(IndexError, lambda: focus_list[0])
+
+    def test_select(self):
+        """Focus list filtering"""
+        focus_list = FocusList(range(10))
+        def even(x):
+            return x % 2 == 0
+        self.assertEqual(list(focus_list.select(even)), [0, 2, 4, 6, 8])
+        focus_list.appendleft(7)
+        self.assertEqual(focus_list.first(lambda x: x > 5), 7)
+        self.assertEqual(focus_list.first(lambda x: x > 10), None)
+
 class FocusTestClient(TestClient):
     def __init__(self, geometry, screen=None,
                  event_mask=EventMask.FocusChange,
@@ -31,12 +68,14 @@ class FocusTestClient(TestClient):
         super(FocusTestClient, self).__init__(geometry, screen,
                                               event_mask=event_mask)
         self.focused = False
+        self.focus_ins = 0
         if input_hint is not None:
             self.wm_hints = WMHints(input=input_hint)
 
     @handler(FocusInEvent)
     def handle_focus_in(self, event):
         self.focused = True
+        self.focus_ins += 1
 
     @handler(FocusOutEvent)
     def handle_focus_out(self, event):
@@ -52,9 +91,10 @@ class FocusPolicyTestCase(WMTestCase):
     # other client windows at this position, either.
     safe_position = Position(1000, 1000)
 
-    def setUp(self, start_wm=True):
+    def setUp(self, start_wm=True, **kwargs):
         super(FocusPolicyTestCase, self).setUp(start_wm=start_wm,
-                                               focus_new_windows=False)
+                                               focus_new_windows=False,
+                                               **kwargs)
         self.conn.core.SetInputFocusChecked(InputFocus.PointerRoot,
                                             InputFocus.PointerRoot,
                                             Time.CurrentTime).check()
@@ -266,6 +306,37 @@ class TestSloppyFocus(FocusPolicyTestCase, SharedFocusPolicyTests):
         # B should still have the focus.
         self.loop(self.make_focus_test(b))
 
+class TestSloppyFocusDelay(FocusPolicyTestCase):
+    """Test sloppy focus with a delay for the pointer to settle."""
+    wm_class = SloppyFocus
+
+    focus_delay = 1 # second; longer than a default test loop
+
+    def setUp(self):
+        super(TestSloppyFocusDelay, self).setUp(focus_delay=self.focus_delay)
+
+    def test_single_enter(self):
+        """Focus immediately when the pointer enters just one window"""
+        client = self.make_client(Geometry(0, 0, 100, 100, 1))
+        start = default_timer()
+        self.warp_pointer(*center(client.geometry))
+        self.loop(self.make_focus_test(client))
+        self.assertTrue(default_timer() - start < self.focus_delay)
+
+    def test_burst(self):
+        """Focus only the last of a burst of windows entered"""
+        clients = [self.make_client(Geometry(i * 110, 0, 100, 100, 1))
+                   for i in range(3)]
+
+        # Sweep the pointer across all of the windows while the manager
+        # can't see it, so that it gets all of the crossing events at once.
+        with grab_server(self.conn):
+            for client in clients:
+                self.warp_pointer(*center(client.geometry))
+        self.loop(self.make_focus_test(clients[-1]),
+                  max_timeouts=int(2 * self.focus_delay / ms))
+        self.assertEqual([client.focus_ins for client in clients], [0, 0, 1])
+
 class TestClickToFocus(FocusPolicyTestCase, SharedFocusPolicyTests):
     wm_class = ClickToFocus
 
@@ -5,12 +5,23 @@ import unittest
 import xcb
 from xcb.xproto import *
 
+from dim.atom import AtomCache
 from dim.fontinfo import FontInfoCache, FontInfo
 from dim.xutil import string16
 
 fn_fixed = "-misc-fixed-medium-r-semicondensed--0-0-75-75-c-0-iso8859-1"
 fn_helvetica = "-*-helvetica-medium-r-*-*-12-*-*-*-*-*-iso10646-1"
 
+class DefaultCharReply(object):
+    """A QueryFont reply with a substitute default character."""
+
+    def __init__(self, reply, default_char):
+        self.reply = reply
+        self.default_char = default_char
+
+    def __getattr__(self, name):
+        return getattr(self.reply, name)
+
 class FontInfoTestCase(unittest.TestCase):
     def setUp(self):
         self.conn = xcb.connect()
@@ -115,5 +126,48 @@ class TestFontInfo(FontInfoTestCase):
         self.assertEqual(self.helvetica_info.text_width(string),
                          self.text_width(self.helvetica, string))
 
+    def test_truncate(self):
+        string = u"The quick brown fox jumps over the lazy dog—1, 2, 2½, …"
+        for font, font_info in ((self.fixed, self.fixed_info),
+                                (self.helvetica, self.helvetica_info)):
+            for s in (string, string * 4):
+                width = font_info.text_width(s)
+                self.assertEqual(width, self.text_width(font, s))
+                self.assertEqual(font_info.truncate(s, width), s)
+                for max_width in (width // 7, width // 3, width - 1):
+                    truncated = font_info.truncate(s, max_width)
+                    self.assertTrue(0 < len(truncated) < len(s))
+                    self.assertTrue(font_info.text_width(truncated) <=
+                                    max_width)
+                self.assertEqual(font_info.truncate(s, 0), "")
+
+    def test_nonexistent_default_char(self):
+        # Substitute a nonexistent character for the default.
+        info = self.helvetica_info
+        nonexistent = [char
+                       for char in range(info.min_char_or_byte2,
+                                         info.max_char_or_byte2 + 1)
+                       if not info.char_info(char, None)]
+        if not nonexistent:
+            self.skipTest("no nonexistent characters in font")
+        reply = self.conn.core.QueryFont(self.helvetica).reply()
+        font_info = FontInfo(DefaultCharReply(reply, nonexistent[0]),
+                             AtomCache(self.conn))
+        self.assertEqual(font_info.default_char_info, None)
+        self.assertEqual(font_info.default_width, 0)
+
+        # Nonexistent and undefined characters take up no space.
+        string = u"The quick brown fox jumps over the lazy dog—1, 2, 2½, …"
+        string = (string + u"".join(map(unichr, nonexistent[:8])) +
+                  u"\ufffe") * 4
+        widths = [char_info.character_width if char_info else 0
+                  for char_info in map(font_info.char_info, string)]
+        self.assertEqual(list(font_info.char_widths(string)), widths)
+        self.assertEqual(font_info.text_width(string), sum(widths))
+        for max_width in (sum(widths) // 3, sum(widths) - 1):
+            truncated = font_info.truncate(string, max_width)
+            self.assertTrue(0 < len(truncated) < len(string))
+            self.assertTrue(font_info.text_width(truncated) <= max_width)
+
 if __name__ == "__main__":
     unittest.main()
@@ -209,6 +209,9 @@ class TestKeyboardMap(MappingTestCase):
             self.assertEqual([list(self.keymap[keycode + i][:4])
                               for i in range(n)],
                              new)
+            for i in range(n):
+                self.assertTrue(keycode + i in
+                                self.keymap.keysym_to_keycodes(new[i][0]))
         finally:
             self.change_keyboard_mapping(keycode, old)
         self.keymap.refresh(keycode, n)
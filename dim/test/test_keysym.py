@@ -3,7 +3,7 @@
 import unittest
 
 from dim.keysym import *
-from dim.keysym import _keysyms # borrow private dictionary from keysymdef
+from dim.keysym import _keysyms, _names # borrow private dictionaries
 from dim import keysymdef
 
 class TestKeysym(unittest.TestCase):
@@ -85,5 +85,16 @@ class TestKeysym(unittest.TestCase):
             self.assertTrue(keysym_to_string(keysym) == keysym_to_string(u) or
                             keysym_to_string(keysym) == keysym_to_string(l))
 
+    def test_case_tables(self):
+        # The precomputed case conversion tables should agree with
+        # conversion by way of strings.
+        def convert(keysym, method):
+            string = getattr(keysym_to_string(keysym), method)()
+            return string_to_keysym(string) or keysym
+
+        for keysym in set(_names) | set(range(0x100)):
+            self.assertEqual(upper(keysym), convert(keysym, "upper"))
+            self.assertEqual(lower(keysym), convert(keysym, "lower"))
+
 if __name__ == "__main__":
     unittest.main()
@@ -573,6 +573,98 @@ class TestWMTransient(WMTestCase):
         self.loop(lambda: (self.client.mapped and
                            self.transient.mapped))
 
+class TestWMTimers(WMTestCase):
+    def setUp(self):
+        super(TestWMTimers, self).setUp(start_wm=False)
+        self.wm = self.wm_thread.wm
+        self.calls = []
+
+    def note(self, x):
+        return lambda: self.calls.append(x)
+
+    def test_schedule(self):
+        """Timer scheduling"""
+        self.assertEqual(self.wm.run_timers(), None)
+        self.wm.schedule(0, self.note(1))
+        self.wm.schedule(10, self.note(2))
+        self.assertEqual(self.wm.run_timers(), 0)
+        self.assertEqual(self.calls, [1])
+        timeout = self.wm.run_timers()
+        self.assertTrue(0 < timeout <= 10)
+        self.assertEqual(self.calls, [1])
+
+    def test_order(self):
+        """Timers expire in deadline order"""
+        self.wm.schedule(2 * ms, self.note(2))
+        self.wm.schedule(1 * ms, self.note(1))
+        self.wm.schedule(2 * ms, self.note(3))
+        sleep(5 * ms)
+        self.assertEqual(self.wm.run_timers(), 0)
+        self.assertEqual(self.calls, [1, 2, 3])
+        self.assertEqual(self.wm.run_timers(), None)
+
+    def test_cancel(self):
+        """Timer cancellation"""
+        timer = self.wm.schedule(0, self.note(1))
+        self.wm.cancel_timer(timer)
+        self.wm.cancel_timer(None)
+        self.assertEqual(self.wm.run_timers(), None)
+        self.assertEqual(self.calls, [])
+
+class TestWMWindowTree(WMTestCase):
+    def setUp(self):
+        super(TestWMWindowTree, self).setUp(start_wm=False)
+        self.wm = self.wm_thread.wm
+
+    def create_window(self, parent):
+        window = self.conn.generate_id()
+        self.conn.core.CreateWindowChecked(self.screen.root_depth,
+                                           window, parent,
+                                           0, 0, 10, 10, 0,
+                                           WindowClass.InputOutput,
+                                           self.screen.root_visual,
+                                           0, []).check()
+        return window
+
+    def test_subwindows(self):
+        """Queried subwindows of clients are indexed by their parents"""
+        # Pretend that a top-level window is a client's frame.
+        top = self.create_window(self.screen.root)
+        sub = self.create_window(top)
+        subsub = self.create_window(sub)
+        self.wm.parents[top] = self.screen.root
+        self.wm.frames[top] = object()
+        self.assertEqual(self.wm.window_parent(subsub), sub)
+        self.assertEqual(self.wm.subwindows[sub], set([subsub]))
+        self.assertEqual(self.wm.subwindows[top], set([sub]))
+        self.assertEqual(self.wm.parents[sub], top)
+
+        # Forgetting a window forgets all of its queried descendants.
+        self.wm.forget_window(sub)
+        self.assertFalse(sub in self.wm.parents)
+        self.assertFalse(subsub in self.wm.parents)
+        self.assertFalse(sub in self.wm.subwindows)
+        self.assertFalse(top in self.wm.subwindows)
+
+        # Forgetting the children of a frame (e.g., when its client is
+        # unmanaged) does the same, without touching the rest.
+        self.assertEqual(self.wm.window_parent(subsub), sub)
+        self.wm.forget_children(top)
+        self.assertFalse(sub in self.wm.parents)
+        self.assertFalse(subsub in self.wm.parents)
+        self.assertEqual(self.wm.subwindows, {})
+        self.assertTrue(top in self.wm.parents)
+
+    def test_foreign_subwindows(self):
+        """Subwindows outside of any client are not remembered"""
+        top = self.create_window(self.screen.root)
+        sub = self.create_window(top)
+        self.assertEqual(self.wm.window_parent(sub), top)
+        self.assertEqual(self.wm.window_parent(top), self.screen.root)
+        self.assertFalse(sub in self.wm.parents)
+        self.assertFalse(top in self.wm.parents)
+        self.assertEqual(self.wm.subwindows, {})
+
 class EventLoopTester(WindowManager):
     """A window manager that records the number of ConfigureNotify events
     that it receives on its client windows."""
@@ -7,6 +7,7 @@ import xcb
 from xcb.xproto import *
 
 from dim.cursor import *
+from dim.event import handler
 from dim.geometry import *
 from dim.keysym import *
 from dim.moveresize import bsearch_floor, bsearch_ceil, \
@@ -163,6 +164,25 @@ class TestClientResize(unittest.TestCase):
                                 Position(5, 10),
                                 width=+5, height=+10)
 
+    def test_cycle_gravity_without_hints(self):
+        g = Geometry(x=0, y=0, width=15, height=30, border_width=1)
+        client = MockClient(self, g)
+        client.manager.motion_hints = False
+        cursors = []
+        def change_cursor(cursor, time=Time.CurrentTime):
+            cursors.append(cursor)
+        resize = ClientResize(None, client, Position(10, 25), None,
+                              lambda time: None, change_cursor)
+        self.assertEqual(cursors, [XC_bottom_right_corner])
+
+        # The connection is a mock, so a pointer query would fail;
+        # the last reported position must be used instead.
+        resize.last_pointer = Position(12, 27)
+        resize.cycle_gravity(Time.CurrentTime)
+        self.assertEqual(len(cursors), 2)
+        self.assertNotEqual(resize.gravity, Position(+1, +1))
+        self.assertEqual(resize.pointer, Position(12, 27))
+
 class ModButtonDown(object):
     """A little context manager for move/resize tests. On enter, simulates
     the press of a modifier key, then a pointer button, and then the release
@@ -192,8 +212,11 @@ class TestMoveResize(WMTestCase):
     button_bindings = {("control", 1): maybe_move_window,
                        ("control", 3): MoveResize.resize_window}
 
+    global_grabs = False
+
     def setUp(self):
-        super(TestMoveResize, self).setUp(button_bindings=self.button_bindings)
+        super(TestMoveResize, self).setUp(button_bindings=self.button_bindings,
+                                          global_grabs=self.global_grabs)
         self.control = self.modmap[MapIndex.Control][0]
         self.initial_geometry = Geometry(x=0, y=0, width=100, height=100,
                                          border_width=1)
@@ -307,6 +330,41 @@ class TestMoveResize(WMTestCase):
                 self.fake_input(EventType.MotionNotify, True, *half_r)
                 self.loop(self.make_geometry_delta_test(r))
 
+class ClickTestClient(TestClient):
+    """A test client that notes button presses in its window."""
+
+    def __init__(self, geometry):
+        super(ClickTestClient, self).__init__(geometry,
+                                              event_mask=EventMask.ButtonPress)
+        self.clicked = False
+
+    @handler(ButtonPressEvent)
+    def handle_button_press(self, event):
+        self.clicked = True
+
+class TestMoveResizeGlobalGrabs(TestMoveResize):
+    """Interactive move/resize with the bindings grabbed on the root."""
+
+    global_grabs = True
+
+    def test_ignore_bindings(self):
+        """Pass root-grabbed clicks through to a client without bindings"""
+        geometry = Geometry(200, 0, 100, 100, 1)
+        client = self.add_client(ClickTestClient(geometry))
+        client.map()
+        self.loop(lambda: client.mapped and client.managed)
+        self.wm_thread.wm.get_client(client.window).global_bindings = False
+        frame_geometry = client.frame_geometry
+
+        # Aim below the titlebar, if there is one.
+        with WarpedPointer(self, (frame_geometry.position() +
+                                  Position(frame_geometry.width // 2,
+                                           frame_geometry.height - 10))):
+            with ModButtonDown(self, self.control, 1):
+                self.fake_input(EventType.MotionNotify, True, 10, 10)
+                self.loop(lambda: client.clicked)
+        self.assertEqual(client.frame_geometry, frame_geometry)
+
 class TestBinarySearch(unittest.TestCase):
     def test_bsearch_floor(self):
         sequence = [(1, 1), (2, 1), (2, 2), (3, 1)]
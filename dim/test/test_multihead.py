@@ -0,0 +1,164 @@
+# -*- mode: Python; coding: utf-8 -*-
+
+import unittest
+
+from dim.geometry import *
+from dim.multihead import HeadIndex, HeadManager
+from dim.properties import WMState
+
+class TestHeadIndex(unittest.TestCase):
+    def setUp(self):
+        #  ┌───────┬─────┐
+        #  │ left  │right│
+        #  ├───────┼─────┘
+        #  │ below │
+        #  └───────┘
+        self.left = Geometry(0, 0, 1920, 1080, 0)
+        self.right = Geometry(1920, 0, 1280, 1024, 0)
+        self.below = Geometry(0, 1080, 1920, 1080, 0)
+        self.index = HeadIndex([self.right, self.below, self.left,
+                                empty_geometry])
+
+    def test_order(self):
+        """Head index order"""
+        self.assertEqual(tuple(self.index),
+                         (self.left, self.below, self.right))
+        self.assertEqual(self.index.positions[self.right], 2)
+
+    def test_locate(self):
+        """Head index point location"""
+        self.assertEqual(self.index.locate(Position(0, 0)), self.left)
+        self.assertEqual(self.index.locate(Position(1919, 1079)), self.left)
+        self.assertEqual(self.index.locate(Position(1920, 0)), self.right)
+        self.assertEqual(self.index.locate(Position(3199, 1023)), self.right)
+        self.assertEqual(self.index.locate(Position(100, 1500)), self.below)
+        self.assertEqual(self.index.locate(Position(3199, 1024)), None)
+        self.assertEqual(self.index.locate(Position(-1, 0)), None)
+        self.assertEqual(self.index.locate(Position(5000, 5)), None)
+
+class MockCore(object):
+    def GrabServer(self):
+        pass
+
+    def UngrabServer(self):
+        pass
+
+class MockConnection(object):
+    def __init__(self):
+        self.core = MockCore()
+
+class MockHeadManager(HeadManager):
+    """A head manager for a fixed set of heads, with no X connection."""
+
+    def __new__(cls, heads):
+        return object.__new__(cls)
+
+    def __init__(self, heads):
+        self.conn = MockConnection()
+        self.heads = heads
+        self.client_heads = {}
+        self._head_index = None
+
+    def __iter__(self):
+        return iter(self.heads)
+
+class MockClient(object):
+    """A client with a 20-pixel titlebar above its window."""
+
+    wm_state = WMState.NormalState
+    offset = Position(0, 20)
+
+    def __init__(self, geometry, saved_geometry=None,
+                 fullscreen=False, maximized=False):
+        self.absolute_geometry = geometry
+        self.saved_geometry = saved_geometry
+        self.fullscreen = fullscreen
+        self.maximized = maximized
+        self.remaximized = False
+
+    def absolute_to_frame_geometry(self, geometry):
+        return geometry - self.offset + Rectangle(*self.offset)
+
+    def frame_to_absolute_geometry(self, geometry):
+        return geometry + self.offset - Rectangle(*self.offset)
+
+    def is_fullscreen(self):
+        return self.fullscreen
+
+    def is_maximized(self):
+        return self.maximized
+
+    def configure(self, geometry):
+        self.absolute_geometry = geometry
+
+    def maximize(self):
+        self.remaximized = True
+
+class TestClientMigration(unittest.TestCase):
+    def setUp(self):
+        self.left = Geometry(0, 0, 1920, 1080, 0)
+        self.right = Geometry(1920, 0, 1280, 1024, 0)
+        self.below = Geometry(0, 1080, 1920, 1080, 0)
+        self.heads = MockHeadManager([self.left, self.right, self.below])
+
+    def test_relocate_geometry(self):
+        """Relocate a geometry to another head"""
+        relocate = self.heads.relocate_geometry
+        self.assertEqual(relocate(Geometry(100, 100, 200, 200, 1),
+                                  self.left, self.right),
+                         Geometry(2020, 100, 200, 200, 1))
+
+        # Geometries that would extend past the new head are pulled back
+        # onto it, border and all.
+        self.assertEqual(relocate(Geometry(1800, 900, 200, 200, 1),
+                                  self.left, self.right),
+                         Geometry(2998, 822, 200, 200, 1))
+
+        # Geometries larger than the new head keep their top-left corner
+        # on it.
+        self.assertEqual(relocate(Geometry(0, 0, 1500, 1100, 0),
+                                  self.left, self.right),
+                         Geometry(1920, 0, 1500, 1100, 0))
+
+    def test_migrate(self):
+        """Migrate clients to a changed head"""
+        client = MockClient(Geometry(100, 120, 200, 180, 1))
+        self.heads.migrate_clients([client], self.left, self.right)
+        self.assertEqual(client.absolute_geometry,
+                         Geometry(2020, 120, 200, 180, 1))
+        self.assertFalse(client.remaximized)
+
+    def test_migrate_maximized(self):
+        """Migrate a maximized client"""
+        client = MockClient(Geometry(0, 20, 1920, 1060, 0),
+                            saved_geometry=Geometry(100, 120, 200, 180, 1),
+                            maximized=True)
+        self.heads.migrate_clients([client], self.left, self.right)
+        self.assertEqual(client.saved_geometry,
+                         Geometry(2020, 120, 200, 180, 1))
+        self.assertEqual(client.absolute_geometry.position(),
+                         self.right.position() + client.offset)
+        self.assertTrue(client.remaximized)
+
+    def test_migrate_fullscreen(self):
+        """Migrate a fullscreen client"""
+        client = MockClient(self.left,
+                            saved_geometry=Geometry(100, 120, 200, 180, 1),
+                            fullscreen=True)
+        self.heads.migrate_clients([client], self.left, self.right)
+        self.assertEqual(client.absolute_geometry, self.right)
+        self.assertEqual(client.saved_geometry,
+                         Geometry(2020, 120, 200, 180, 1))
+
+    def test_migrate_disabled_head(self):
+        """Migrate clients from a disabled head"""
+        # The left head has gone away; its clients should land on the
+        # top-left-most remaining one.
+        self.heads.heads = [self.right, self.below]
+        client = MockClient(Geometry(100, 120, 200, 180, 1))
+        self.heads.migrate_clients([client], self.left, None)
+        self.assertEqual(client.absolute_geometry,
+                         Geometry(100, 1200, 200, 180, 1))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,11 +11,13 @@ from xcb.xproto import *
 
 from dim.event import *
 from dim.geometry import *
-from dim.properties import AtomList
-from dim.tags import (TagMachineError, TagMachine, TagManager, SpecSyntaxError,
+from dim.keysym import *
+from dim.properties import AtomList, WMState
+from dim.tags import (TagMachineError, TagMachine, ClientTagMachine,
+                      TagManager, SpecSyntaxError,
                       tokenize, parse_tagset_spec, send_tagset_expr)
 
-from test_manager import TestClient, WMTestCase
+from test_manager import EventType, TestClient, WMTestCase
 
 def primes(n):
     """Return prime numbers < n. Thanks to Ulf Bartelt, via the Python
@@ -170,15 +172,142 @@ class TestTagMachine(unittest.TestCase):
         self.tvm.run(["'", "big-even", "big", "even", "∩", "="])
         self.assertStackEqual(self.tvm, big_even)
         self.assertEqual(self.tagsets["big-even"], big_even)
+        self.assertEqual(self.tvm.assigned, set(["big-even"]))
 
         # Expression (alias) assignment
         big_odd = self.tagsets["big"] & self.tagsets["odd"]
         self.tvm.run(["'", "big-odd", "{", "big", "odd", "∩", "}", "="])
         self.assertStackEqual(self.tvm, big_odd)
         self.assertFalse("big-odd" in self.tagsets)
+        self.assertFalse("big-odd" in self.tvm.assigned)
         self.tvm.run(["big-odd"])
         self.assertStackEqual(self.tvm, big_odd)
 
+    def test_procedure(self):
+        """Tag machine procedures"""
+        self.tvm.run(["'", "p", "{", "'", "q", "{", "prime", "}", "=",
+                      "even", "∩", "}", "="])
+        self.assertStackEqual(self.tvm,
+                              self.tagsets["prime"] & self.tagsets["even"])
+        self.tvm.run(["q", "p", "odd", "∪"])
+        self.assertStackEqual(self.tvm,
+                              ((self.tagsets["prime"] & self.tagsets["even"]) |
+                               self.tagsets["odd"]),
+                              self.tagsets["prime"])
+
+        # A procedure may be called later in the stream that defines it.
+        self.tvm.run(["'", "r", "{", "big", "}", "=", "r", "∩"])
+        self.assertStackEqual(self.tvm, self.tagsets["big"])
+
+    def test_compile(self):
+        """Tag machine program cache"""
+        program = self.tvm.compile(["even", "{", "odd", "}", "∪"])
+        self.assertTrue(program is
+                        self.tvm.compile(["even", "{", "odd", "}", "∪"]))
+        self.assertFalse(program is self.tvm.compile(["even", "odd", "∪"]))
+
+class StateClient(object):
+    """A fake client that records state transitions."""
+
+    def __init__(self, wm_state):
+        self.wm_state = wm_state
+        self.transitions = 0
+
+    def normalize(self):
+        self.wm_state = WMState.NormalState
+        self.transitions += 1
+
+    def iconify(self):
+        self.wm_state = WMState.IconicState
+        self.transitions += 1
+
+class TestTagMachineShow(unittest.TestCase):
+    def setUp(self):
+        self.clients = dict((i, StateClient(WMState.NormalState if i < 5
+                                            else WMState.IconicState))
+                            for i in range(10))
+        self.tagsets = {"low": set(self.clients[i] for i in range(5)),
+                        "even": set(self.clients[i] for i in range(0, 10, 2))}
+        self.tvm = TagMachine(self.clients, self.tagsets,
+                              {"!": "show", "∁": "complement"})
+
+    def test_show(self):
+        """Tag machine show touches only changed clients"""
+        self.tvm.run(["low", "!"])
+        self.assertFalse(any(client.transitions
+                             for client in self.clients.values()))
+
+        self.tvm.run(["even", "!"])
+        for i, client in self.clients.items():
+            self.assertEqual(client.wm_state,
+                             WMState.NormalState if i % 2 == 0
+                             else WMState.IconicState)
+            self.assertEqual(client.transitions,
+                             1 if (i < 5) != (i % 2 == 0) else 0)
+
+    def test_live_view(self):
+        """Client tag machine updates a single client"""
+        self.tvm.run(["low", "∁", "!"])
+        view = ClientTagMachine(self.tvm)
+        for client in self.clients.values():
+            client.transitions = 0
+
+        # Moving a client into the complement of the view shows it.
+        self.tagsets["low"].discard(self.clients[0])
+        view.update(self.clients[0])
+        self.assertEqual(self.clients[0].wm_state, WMState.NormalState)
+        self.assertEqual(sum(client.transitions
+                             for client in self.clients.values()), 1)
+
+        # Updating a client whose membership hasn't changed does nothing.
+        view.update(self.clients[9])
+        self.assertEqual(self.clients[9].transitions, 0)
+
+    def test_member(self):
+        """Client tag machine view membership"""
+        self.tvm.run(["even", "!"])
+        self.assertEqual(self.tvm.shown, self.tagsets["even"])
+        view = ClientTagMachine(self.tvm, change_states=lambda *args: None)
+        self.tvm.run(["low", "!"])
+        self.assertTrue(view.member(self.clients[8]))
+        self.assertFalse(view.member(self.clients[3]))
+        self.assertEqual(self.clients[8].wm_state, WMState.IconicState)
+
+    def test_redefined_procedure(self):
+        """Client tag machine follows procedure redefinitions"""
+        tvm = TagMachine(self.clients, self.tagsets,
+                         {"!": "show", "{": "begin", "}": "end",
+                          "'": "quote", "=": "assign"})
+        tvm.run(["'", "p", "{", "low", "}", "="])
+        tvm.clear()
+        tvm.run(["p", "!"])
+        view = ClientTagMachine(tvm, change_states=lambda *args: None)
+        self.assertTrue(view.member(self.clients[1]))
+        self.assertFalse(view.member(self.clients[6]))
+
+        tvm.run(["'", "p", "{", "even", "}", "="])
+        tvm.clear()
+        self.assertFalse(view.member(self.clients[1]))
+        self.assertTrue(view.member(self.clients[6]))
+        self.assertTrue(view.depends_on(["even"]))
+        self.assertFalse(view.depends_on(["low"]))
+
+    def test_dependencies(self):
+        """Client tag machine view dependencies"""
+        self.tvm.run(["low", "!"])
+        view = ClientTagMachine(self.tvm, change_states=lambda *args: None)
+        self.assertTrue(view.depends_on(["low"]))
+        self.assertFalse(view.depends_on(["even"]))
+        self.assertFalse(view.depends_on(["even"], new=True))
+
+        # A new client in none of the view's tagsets may still belong
+        # to a complement.
+        self.tvm.run(["low", "∁", "!"])
+        view = ClientTagMachine(self.tvm, change_states=lambda *args: None)
+        self.assertTrue(view.depends_on(["low"]))
+        self.assertFalse(view.depends_on(["even"]))
+        self.assertTrue(view.depends_on(["even"], new=True))
+
 class TestTokenizer(unittest.TestCase):
     def test_tag(self):
         """Tokenize tags"""
@@ -214,6 +343,12 @@ class TestParser(unittest.TestCase):
         self.assertEqual(parse_tagset_spec(r"~(a | b) \ c & ~d"),
                          ["a", "b", "∪", "∁", "c", "d", "∁", "∩", "∖"])
 
+    def test_parse_cache(self):
+        """Tagset specification parse cache"""
+        expr = parse_tagset_spec("a | b")
+        expr.append("c")
+        self.assertEqual(parse_tagset_spec("a | b"), ["a", "b", "∪"])
+
     def test_syntax_errors(self):
         """Tagset specification syntax errors"""
         self.assertRaises(SpecSyntaxError, lambda: parse_tagset_spec("| x"))
@@ -247,13 +382,16 @@ class TaggedClient(TestClient):
 class TestTagManager(WMTestCase):
     wm_class = TagManager
 
-    def setUp(self):
-        super(TestTagManager, self).setUp()
+    live_tagsets = False
+
+    def setUp(self, **kwargs):
+        super(TestTagManager, self).setUp(live_tagsets=self.live_tagsets,
+                                          **kwargs)
         self.tagsets = defaultdict(set)
         self.all_clients = []
 
-    def send_tagset_expr(self, expr):
-        send_tagset_expr(self.conn, expr, show=True, atoms=self.atoms)
+    def send_tagset_expr(self, expr, show=True):
+        send_tagset_expr(self.conn, expr, show=show, atoms=self.atoms)
         self.conn.flush()
 
     def make_client(self, tags):
@@ -320,5 +458,134 @@ class TestTagManager(WMTestCase):
         self.send_tagset_expr(["∅"])
         self.loop(self.make_mapped_test(wild))
 
+    def test_assigned_tagsets(self):
+        """Assigned tagsets outlive their clients"""
+        a = self.make_client(["a"])
+        b = self.make_client(["b"])
+        self.loop(self.make_ready_test())
+
+        wm = self.wm_thread.wm
+        tag = self.atoms["b"]
+        def tagged_windows():
+            return set(client.window for client in wm.tagsets.get(tag, ()))
+        self.send_tagset_expr(parse_tagset_spec("b = a"), show=False)
+        self.loop(lambda: tagged_windows() == set([a.window]))
+
+        # Neither the departure of the last client in the assigned tagset
+        # nor that of the last client explicitly tagged "b" should discard
+        # the tagset.
+        a.destroy()
+        self.loop(lambda: a.destroyed and a.window not in wm.clients)
+        self.assertEqual(tagged_windows(), set())
+        b.destroy()
+        self.loop(lambda: b.destroyed and b.window not in wm.clients)
+        self.assertTrue(tag in wm.tagsets)
+
+class TestLiveTagsets(TestTagManager):
+    live_tagsets = True
+
+    def test_live_tagsets(self):
+        """Live tagsets"""
+        a = self.make_client(["a"])
+        b = self.make_client(["b"])
+        c = self.make_client(["c"])
+        self.loop(self.make_ready_test())
+
+        procedures = self.wm_thread.wm.tag_machine.procedures
+        def defined(name, body):
+            return lambda: (procedures.get(self.atoms[name]) ==
+                            [self.atoms[x] for x in body])
+        self.send_tagset_expr(parse_tagset_spec("p = {b}"), show=False)
+        self.loop(defined("p", ["b"]))
+        self.send_tagset_expr(["p"])
+        self.loop(self.make_mapped_test([b]))
+
+        # Redefining the procedure in the view shows the view again.
+        self.send_tagset_expr(parse_tagset_spec("p = {a}"), show=False)
+        self.loop(defined("p", ["a"]))
+        self.loop(self.make_mapped_test([a]))
+
+        # Retagging a client shows or hides just that client.
+        c.setprop("_DIM_TAGS", AtomList([self.atoms["a"]]))
+        self.loop(self.make_mapped_test([a, c]))
+
+def previous_view(wm, event):
+    wm.show_previous_view(event.time)
+
+def next_view(wm, event):
+    wm.show_next_view(event.time)
+
+class TestViewHistory(TestTagManager):
+    """Test the view history, which we navigate with key bindings grabbed
+    on the root window."""
+
+    def setUp(self):
+        super(TestViewHistory, self).setUp(key_bindings={XK_F1: previous_view,
+                                                         XK_F2: next_view},
+                                           global_grabs=True)
+
+    def press(self, keysym):
+        keycode = self.keymap.keysym_to_keycode(keysym)
+        self.fake_input(EventType.KeyPress, keycode)
+        self.fake_input(EventType.KeyRelease, keycode)
+
+    def test_view_history(self):
+        """Tagset view history"""
+        a = self.make_client(["a"])
+        b = self.make_client(["b"])
+        c = self.make_client(["c"])
+        self.loop(self.make_ready_test())
+
+        for tag, client in (("a", a), ("b", b), ("c", c)):
+            self.send_tagset_expr([tag])
+            self.loop(self.make_mapped_test([client]))
+
+        self.press(XK_F1)
+        self.loop(self.make_mapped_test([b]))
+        self.press(XK_F1)
+        self.loop(self.make_mapped_test([a]))
+        self.press(XK_F2)
+        self.loop(self.make_mapped_test([b]))
+
+        # Showing a new view discards the ones after the current one.
+        self.send_tagset_expr(["a", "c", "_DIM_TAGSET_UNION"])
+        self.loop(self.make_mapped_test([a, c]))
+        self.press(XK_F2)
+        self.press(XK_F1)
+        self.loop(self.make_mapped_test([b]))
+
+        # The membership of past views is kept up to date.
+        d = self.make_client(["b"])
+        self.loop(lambda: d.managed)
+        self.press(XK_F1)
+        self.loop(self.make_mapped_test([a]))
+        self.press(XK_F2)
+        self.loop(self.make_mapped_test([b, d]))
+
+    def test_redefined_view(self):
+        """Tagset view history follows procedure redefinitions"""
+        a = self.make_client(["a"])
+        b = self.make_client(["b"])
+        c = self.make_client(["c"])
+        self.loop(self.make_ready_test())
+
+        procedures = self.wm_thread.wm.tag_machine.procedures
+        def defined(name, body):
+            return lambda: (procedures.get(self.atoms[name]) ==
+                            [self.atoms[x] for x in body])
+        self.send_tagset_expr(parse_tagset_spec("p = {a}"), show=False)
+        self.loop(defined("p", ["a"]))
+        self.send_tagset_expr(["p"])
+        self.loop(self.make_mapped_test([a]))
+        self.send_tagset_expr(["b"])
+        self.loop(self.make_mapped_test([b]))
+
+        # Going back to a view that uses a redefined procedure shows the
+        # view according to the new definition.
+        self.send_tagset_expr(parse_tagset_spec("p = {c}"), show=False)
+        self.loop(defined("p", ["c"]))
+        self.press(XK_F1)
+        self.loop(self.make_mapped_test([c]))
+
 if __name__ == "__main__":
     unittest.main()
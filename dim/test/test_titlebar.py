@@ -0,0 +1,120 @@
+# -*- mode: Python; coding: utf-8 -*-
+
+import unittest
+
+from dim.geometry import *
+from dim.titlebar import SimpleTitlebar, layout_title, title_layouts
+
+class MockFontInfo(object):
+    """A font in which every character is one pixel wide, and which counts
+    the number of times it's asked to truncate a string."""
+
+    def __init__(self):
+        self.truncations = 0
+
+    def truncate(self, string, max_width):
+        self.truncations += 1
+        return string[:max_width]
+
+class MockCore(object):
+    def __init__(self):
+        self.text = []
+
+    def PolyFillRectangle(self, *args):
+        pass
+
+    def PolyLine(self, *args):
+        pass
+
+    def PolyText16(self, window, gc, x, y, n, text_items):
+        self.text.append((n, text_items))
+
+class MockConnection(object):
+    def __init__(self):
+        self.core = MockCore()
+
+class MockTitlebarConfig(object):
+    font = 1
+    margin = 2
+    baseline = 10
+    fg_gc = bg_gc = highlight_gc = lowlight_gc = black_gc = None
+
+    def __init__(self):
+        self.font_info = MockFontInfo()
+
+class TestLayoutTitle(unittest.TestCase):
+    def setUp(self):
+        title_layouts.clear()
+        self.font_info = MockFontInfo()
+
+    def tearDown(self):
+        title_layouts.clear()
+
+    def test_layout(self):
+        """Title layout"""
+        title, n, text_items = layout_title(1, self.font_info,
+                                            u"Hello, world", 5)
+        self.assertEqual(title, u"Hello")
+        self.assertEqual(n, 1)
+        self.assertEqual(text_items, "\x05\x00" + u"Hello".encode("UTF-16BE"))
+
+    def test_cache(self):
+        """Title layout cache"""
+        layout = layout_title(1, self.font_info, u"Hello, world", 5)
+        self.assertTrue(layout_title(1, self.font_info,
+                                     u"Hello, world", 5) is layout)
+        self.assertEqual(self.font_info.truncations, 1)
+
+        # A different font or width needs a new layout.
+        layout_title(2, self.font_info, u"Hello, world", 5)
+        layout_title(1, self.font_info, u"Hello, world", 6)
+        self.assertEqual(self.font_info.truncations, 3)
+
+    def test_eviction(self):
+        """Title layout cache evicts the least recently used layout"""
+        def layout(i):
+            return layout_title(1, self.font_info, u"Title %d" % i, 100,
+                                max_cached=4)
+        for i in range(4):
+            layout(i)
+        layout(0)
+        self.assertEqual(self.font_info.truncations, 4)
+
+        layout(4)
+        self.assertEqual(len(title_layouts), 4)
+        self.assertFalse((1, u"Title 1", 100) in title_layouts)
+        self.assertTrue((1, u"Title 0", 100) in title_layouts)
+        layout(0)
+        self.assertEqual(self.font_info.truncations, 5)
+        layout(1)
+        self.assertEqual(self.font_info.truncations, 6)
+
+class TestSimpleTitlebar(unittest.TestCase):
+    def setUp(self):
+        title_layouts.clear()
+
+        # We don't need a window to draw into, so we skip the usual
+        # initialization and supply just what the draw method uses.
+        self.titlebar = SimpleTitlebar.__new__(SimpleTitlebar)
+        self.titlebar.conn = MockConnection()
+        self.titlebar.config = MockTitlebarConfig()
+        self.titlebar.geometry = Geometry(0, 0, 10, 20, 0)
+        self.titlebar.window = 0
+        self.titlebar.title = u"Hello, world"
+
+    def tearDown(self):
+        title_layouts.clear()
+
+    def test_draw(self):
+        """Titlebar redraws use the cached title layout"""
+        self.titlebar.draw()
+        self.titlebar.draw()
+        text = self.titlebar.conn.core.text
+        self.assertEqual(len(text), 2)
+        self.assertEqual(text[0], text[1])
+        self.assertEqual(text[0][1],
+                         "\x06\x00" + u"Hello,".encode("UTF-16BE"))
+        self.assertEqual(self.titlebar.config.font_info.truncations, 1)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,7 @@
 # -*- mode: Python; coding: utf-8 -*-
 
+from collections import OrderedDict
+
 from xcb.xproto import *
 
 from event import *
@@ -11,6 +13,27 @@ from xutil import textitem16
 
 __all__ = ["Titlebar", "SimpleTitlebar", "IconTitlebar", "InputFieldTitlebar"]
 
+# Titlebars are redrawn on every focus change and exposure, but their titles
+# and widths rarely change; we therefore keep the truncated and encoded
+# titles in a small cache, indexed by (font, title, width) and maintained
+# in least-recently-used order.
+title_layouts = OrderedDict()
+
+def layout_title(font, font_info, title, width, max_cached=256):
+    """Return a tuple of the given title truncated to fit in the given width,
+    the number of TEXTITEM16s needed to draw it, and their encoding."""
+    key = (font, title, width)
+    try:
+        layout = title_layouts.pop(key)
+    except KeyError:
+        title = font_info.truncate(title, width)
+        text_items = list(textitem16(title))
+        layout = (title, len(text_items), "".join(text_items))
+        if len(title_layouts) >= max_cached:
+            title_layouts.popitem(last=False)
+    title_layouts[key] = layout
+    return layout
+
 class Titlebar(Widget):
     """A widget which displays a line of text. A titlebar need not display
     a window title; it can be used for other purposes."""
@@ -63,11 +86,12 @@ class SimpleTitlebar(Titlebar):
         if not self.title:
             self.title = self.client.title
         width = self.geometry.width - 2 * self.config.margin
-        title = self.config.font_info.truncate(unicode(self.title), width)
-        text_items = list(textitem16(title))
+        title, n, text_items = layout_title(self.config.font,
+                                            self.config.font_info,
+                                            unicode(self.title), width)
         self.conn.core.PolyText16(self.window, self.config.fg_gc,
                                   self.config.margin, self.config.baseline,
-                                  len(text_items), "".join(text_items))
+                                  n, text_items)
 
     def client_title_changed(self, window, *args):
         assert window is self.client.window
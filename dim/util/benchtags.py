@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# -*- mode: Python; coding: utf-8 -*-
+
+"""Benchmark the tag machine on synthetic client populations.
+
+The tag machine does not depend on X, so we can exercise it with far more
+clients than a test display could reasonably hold. Each synthetic client
+is given between one and three tags drawn from a Zipf-like distribution:
+a few tags are very popular, and most are rare.
+
+For each population size and each expression, we time five phases:
+parsing the specification, compiling the resulting instructions,
+evaluating the compiled program, showing its result when every client is
+already in the right state (i.e., just computing the difference), and
+switching between the result and its complement, which changes the state
+of every client. Results are printed, and may also be appended to a file,
+one tab-separated line per measurement, so that they can be compared over
+time."""
+
+from __future__ import unicode_literals
+
+from bisect import bisect
+from collections import defaultdict
+from random import Random
+from time import strftime
+from timeit import default_timer
+
+from dim.properties import WMState
+from dim.tags import (TagMachine, parse_tagset_spec, parsed_specs,
+                      tagset_expr_names, tag_machine_opcodes)
+
+__all__ = ["make_population", "make_expressions", "run_benchmarks"]
+
+class SyntheticClient(object):
+    """Just enough of a client for the tag machine's show operation."""
+
+    __slots__ = ("wm_state",)
+
+    def __init__(self):
+        self.wm_state = WMState.NormalState
+
+    def normalize(self):
+        self.wm_state = WMState.NormalState
+
+    def iconify(self):
+        self.wm_state = WMState.IconicState
+
+def make_population(n, tags=None, seed=0):
+    """Return a dictionary of n synthetic clients and a dictionary of the
+    tagsets that contain them."""
+    random = Random(seed)
+    tags = tags or max(10, n // 10)
+    weights = []
+    total = 0.0
+    for i in range(tags):
+        total += 1.0 / (i + 1)
+        weights.append(total)
+    clients = {}
+    tagsets = defaultdict(set)
+    for i in range(n):
+        client = clients[i] = SyntheticClient()
+        for j in range(random.randint(1, 3)):
+            tag = bisect(weights, random.random() * total)
+            tagsets["tag%d" % tag].add(client)
+    return clients, tagsets
+
+def make_expressions(tagsets, depth=50):
+    """Return a list of (name, specification) pairs: first some typical
+    expressions, then some adversarial ones."""
+    return [("single", "tag0"),
+            ("union", "tag0 | tag1"),
+            ("mixed", "(tag0 | tag1) & ~tag2 \\ tag3"),
+            ("complement", "~tag0"),
+            ("all", "*"),
+            ("wide", " | ".join(sorted(tagsets))),
+            ("deep", "(" * depth + "tag0" + " | tag1)" * depth)]
+
+def time_phase(function, repeat=3, min_time=0.05):
+    """Return the best time per call of the given function over several
+    trials, each of which runs for at least min_time seconds."""
+    best = None
+    for i in range(repeat):
+        calls = 0
+        start = default_timer()
+        while True:
+            function()
+            calls += 1
+            elapsed = default_timer() - start
+            if elapsed >= min_time:
+                break
+        if best is None or elapsed / calls < best:
+            best = elapsed / calls
+    return best
+
+def benchmark_expression(machine, spec):
+    """Yield (phase, seconds) pairs for the given specification."""
+    def parse():
+        parsed_specs.clear()
+        parse_tagset_spec(spec)
+    yield "parse", time_phase(parse)
+
+    expr = tagset_expr_names(parse_tagset_spec(spec))
+    def compile():
+        machine.programs.clear()
+        machine.compile(expr)
+    yield "compile", time_phase(compile)
+
+    def evaluate():
+        machine.run(expr)
+        machine.clear()
+    yield "evaluate", time_phase(evaluate)
+
+    view = expr + ["_DIM_TAGSET_SHOW"]
+    machine.run(view)
+    yield "show", time_phase(lambda: machine.run(view))
+
+    inverse = expr + ["_DIM_TAGSET_COMPLEMENT", "_DIM_TAGSET_SHOW"]
+    def switch():
+        machine.run(inverse)
+        machine.run(view)
+    yield "switch", time_phase(switch) / 2
+
+def run_benchmarks(sizes=(100, 1000, 10000), output=None, log=None):
+    """Run the benchmarks for populations of the given sizes. Results are
+    written to the file-like object log (if supplied) in a readable form,
+    and appended to the file named by output (if supplied)."""
+    date = strftime("%Y-%m-%dT%H:%M:%S")
+    results = []
+    for n in sizes:
+        clients, tagsets = make_population(n)
+        machine = TagMachine(clients, tagsets, tag_machine_opcodes)
+        for name, spec in make_expressions(tagsets):
+            for phase, seconds in benchmark_expression(machine, spec):
+                results.append((n, name, phase, seconds))
+                if log:
+                    log.write("%6d clients  %-10s  %-8s  %10.2f us\n" %
+                              (n, name, phase, seconds * 1e6))
+    if output:
+        with open(output, "a") as output_file:
+            for result in results:
+                output_file.write("%s\t%d\t%s\t%s\t%.3e\n" %
+                                  ((date,) + result))
+    return results
+
+if __name__ == "__main__":
+    from optparse import OptionParser
+    import sys
+
+    optparser = OptionParser("Usage: %prog [OPTIONS]")
+    optparser.add_option("-s", "--sizes",
+                         dest="sizes", default="100,1000,10000",
+                         metavar="N,...",
+                         help="client population sizes (default: %default)")
+    optparser.add_option("-o", "--output",
+                         dest="output", metavar="FILE",
+                         help="append results to FILE")
+    (options, args) = optparser.parse_args()
+    run_benchmarks(map(int, options.sizes.split(",")),
+                   output=options.output,
+                   log=sys.stdout)
@@ -19,7 +19,12 @@ The third generated definition is a map from Unicode characters to keysym
 codes, which we represent by a Python dictionary named "_keysyms".
 
 The fourth is a map from legacy keysym codes to Unicode characters, which
-we call "_legacy_codes". It is also a dictionary."""
+we call "_legacy_codes". It is also a dictionary.
+
+Finally, we generate a pair of case conversion tables, "_upper_case" and
+"_lower_case", which map keysym codes to the codes of the corresponding
+uppercase and lowercase keysyms. Only keysyms that differ from their
+converted forms are included."""
 
 from operator import itemgetter
 import re
@@ -40,6 +45,9 @@ mnemonic_patterns = map(lambda pattern: re.compile(pattern, re.VERBOSE),
 def is_legacy_keysym(keysym):
     return 0x100 <= keysym <= 0x20ff
 
+def is_latin1_keysym(keysym):
+    return keysym < 0x100
+
 def is_unicode_keysym(keysym):
     return (keysym & 0xff000000) == 0x01000000
 
@@ -63,6 +71,13 @@ def make_keysym_def(input, output):
     # is not serialized to the output file; it's for internal use only.
     keysyms_seen = set()
 
+    # For generating the case conversion tables, we also need to know the
+    # character (if any) denoted by each keysym code, and the mnemonic
+    # that each character maps to in the keysyms dictionary.
+    chars = {} # keysym code → (mnemonic, Unicode character) map
+    char_mnemonics = {} # Unicode character → mnemonic map
+    codes = {} # mnemonic → keysym code map
+
     for line in input:
         for pattern in mnemonic_patterns:
             match = pattern.match(line)
@@ -80,6 +95,7 @@ def make_keysym_def(input, output):
             continue # skip this line of input
 
         output.write("%s = %s\n" % (mnemonic, code))
+        codes[mnemonic] = keysym
 
         if is_unicode_keysym(keysym):
             # For Unicode keysyms, the keysym code is authoritative.
@@ -94,13 +110,31 @@ def make_keysym_def(input, output):
             char = None
         if char and char not in keysyms:
             keysyms[repr(char)] = mnemonic
+            char_mnemonics[char] = mnemonic
 
         if keysym not in keysyms_seen:
             names[mnemonic] = repr(name)
             if char and is_legacy_keysym(keysym):
                 legacy_codes[mnemonic] = repr(char)
+            # Mirror the interpretation of keysym.keysym_to_string.
+            if is_latin1_keysym(keysym):
+                chars[keysym] = (mnemonic, unichr(keysym))
+            elif (is_unicode_keysym(keysym) or
+                  (char and is_legacy_keysym(keysym))):
+                chars[keysym] = (mnemonic, char)
             keysyms_seen.add(keysym)
 
+    # Precompute the results of converting each keysym's character to
+    # upper- or lowercase and mapping it back to a keysym.
+    upper_case = {}
+    lower_case = {}
+    for keysym, (mnemonic, char) in chars.items():
+        for table, convert in ((upper_case, unicode.upper),
+                               (lower_case, unicode.lower)):
+            other = char_mnemonics.get(convert(char))
+            if other and codes[other] != keysym:
+                table[mnemonic] = other
+
     def pprint_dict(name, d):
         output.write("\f\n%s = {\n" % name)
         for key, value in sorted(d.items(), key=itemgetter(0)):
@@ -110,6 +144,8 @@ def make_keysym_def(input, output):
     pprint_dict("_names", names)
     pprint_dict("_keysyms", keysyms)
     pprint_dict("_legacy_codes", legacy_codes)
+    pprint_dict("_upper_case", upper_case)
+    pprint_dict("_lower_case", lower_case)
 
 if __name__ == "__main__":
     import os
@@ -139,6 +139,7 @@ class Widget(EventHandler):
                                      (event_mask
                                       if event_mask is not None
                                       else self.event_mask)])
+        self.manager.parents[self.window] = self.parent
         self.manager.register_window_handler(self.window, self)
         return self.window
 
@@ -153,6 +154,7 @@ class Widget(EventHandler):
     def destroy(self):
         """Destroy the widget and all of its windows."""
         self.conn.core.DestroyWindow(self.window)
+        self.manager.parents.pop(self.window, None)
 
     def configure(self, geometry):
         """Update the widget for a new geometry."""
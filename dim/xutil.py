@@ -178,14 +178,26 @@ def send_client_message(connection, destination, propagate, event_mask,
             else connection.core.SendEvent(bool(propagate), destination,
                                            event_mask, event))
 
+server_grabs = {} # nesting depth of server grabs, indexed by connection
+
 @contextmanager
 def grab_server(connection):
-    """A context manager that executes its body with the server grabbed."""
-    connection.core.GrabServer()
+    """A context manager that executes its body with the server grabbed.
+    Grabs may be nested; only the outermost one is sent to the server, since
+    an UngrabServer request releases the grab no matter how many GrabServer
+    requests preceded it."""
+    depth = server_grabs.get(connection, 0)
+    if not depth:
+        connection.core.GrabServer()
+    server_grabs[connection] = depth + 1
     try:
         yield
     finally:
-        connection.core.UngrabServer()
+        if depth:
+            server_grabs[connection] = depth
+        else:
+            del server_grabs[connection]
+            connection.core.UngrabServer()
 
 @contextmanager
 def mask_events(connection, window, event_mask, bits, check=False):
@@ -22,6 +22,8 @@ class IgnoreBindingsClient(Client):
     WARNING: If such a client becomes the only one available to receive
     the keyboard focus, it may be difficult to resume full window manager
     functionality."""
+    global_bindings = False
+
     def establish_grabs(self, *args, **kwargs):
         pass
 
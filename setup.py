@@ -12,7 +12,9 @@ aware of the new command and its options). The actual generation
 routines are in their own modules, which export a simple functional
 interface that we use here.
 
-We also add a new "test" command, which executes the test suite.
+We also add a new "test" command, which executes the test suite, and
+a "bench" command, which runs the tag machine benchmarks and appends
+the results to a file (bench_output.txt by default).
 The test suite must be run on a display that does not already have
 a window manager running; a nesting X server such as Xephyr or Xnest
 may be useful here."""
@@ -20,6 +22,7 @@ may be useful here."""
 from contextlib import contextmanager
 from glob import glob
 import os
+import sys
 
 from distutils.cmd import Command
 from distutils.command.build import build as _build
@@ -83,7 +86,13 @@ class generate_py(Command):
             else:
                 raise DistutilsFileError("can't find source file '%s'" % source)
 
-            if self.force or newer(source_filename, module_filename):
+            # Regenerate if either the source file or the generator itself
+            # has changed since the module was last generated.
+            generator_filename = os.path.splitext(
+                sys.modules[generator.__module__].__file__)[0] + ".py"
+            if (self.force or
+                newer(source_filename, module_filename) or
+                newer(generator_filename, module_filename)):
                 log.info("generating %s from %s" % (module_filename,
                                                     source_filename))
                 if not self.dry_run:
@@ -142,6 +151,29 @@ class test(AutogenCommand):
         with display(self.display):
             TextTestRunner(verbosity=self.verbose).run(tests)
 
+class bench(Command):
+    description = "run the tag machine benchmarks"
+    user_options = [("sizes=", "s",
+                     "client population sizes (separated by ',')"),
+                    ("output=", "o", "append results to the given file")]
+
+    def initialize_options(self):
+        self.sizes = None
+        self.output = None
+
+    def finalize_options(self):
+        if self.sizes is None:
+            self.sizes = "100,1000,10000"
+        if self.output is None:
+            self.output = "bench_output.txt"
+
+    def run(self):
+        # The benchmarks need the tag machine, but not an X server.
+        from dim.util.benchtags import run_benchmarks
+        run_benchmarks(map(int, self.sizes.split(",")),
+                       output=self.output,
+                       log=sys.stdout)
+
 class Distribution(AutogenDistribution, TestDistribution):
     pass
 
@@ -156,5 +188,6 @@ setup(name="dim",
       autogen_modules=[("cursorfont.h", "dim.cursorfont", make_cursor_font),
                        ("keysymdef.h", "dim.keysymdef", make_keysym_def)],
       autogen_source_dirs=["/usr/local/include/X11", "/usr/include/X11"],
-      cmdclass={"build": build, "generate_py": generate_py, "test": test},
+      cmdclass={"build": build, "generate_py": generate_py, "test": test,
+                "bench": bench},
       distclass=Distribution)